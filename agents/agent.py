@@ -1,25 +1,120 @@
 """LLM-based agent implementation that uses a ReAct loop."""
+import functools
+import hashlib
+import importlib.util
 import inspect
+import itertools
 import json
-from typing import List, Optional
+import os
+import ssl
+import types
+import typing
+from typing import Dict, List, Optional, Sequence
 
+import certifi
 import httpx
+import orjson
 
 from agents.base import IAgent
 from core.types import AgentMessage, Result, ToolCall
 from tools.robot_tools import RobotTools
 
 
+# HTTP/2 lets concurrent requests (e.g. LLMMode.run_batch) share one connection; it needs the optional h2 package.
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@functools.cache
+def _ssl_context() -> ssl.SSLContext:
+    """
+    Builds the SSL context from the same trust store httpx would load on its own:
+    SSL_CERT_FILE / SSL_CERT_DIR when set (e.g. a corporate proxy CA), certifi's bundle otherwise.
+    Loading the CA bundle is the expensive part, so it is done once, on first use (after .env is loaded),
+    and every client shares the context.
+    """
+    cafile = os.environ.get("SSL_CERT_FILE")
+    capath = os.environ.get("SSL_CERT_DIR")
+    cafile = cafile if cafile and os.path.isfile(cafile) else None
+    capath = capath if capath and os.path.isdir(capath) else None
+    if cafile or capath:
+        return ssl.create_default_context(cafile=cafile, capath=capath)
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+# JSON schema type for each supported parameter annotation; anything else is described as a string.
+_TYPE_MAP = {int: "number", float: "number", bool: "boolean", str: "string", type(None): "null"}
+
+
+def _json_type(annotation) -> str:
+    """Maps a parameter annotation to a JSON schema type, looking through Optional and Union."""
+    json_type = _TYPE_MAP.get(annotation)
+    if json_type is not None:
+        return json_type
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        # Optional[X] is described by X; other unions only when all members map to the same type
+        members = {_TYPE_MAP.get(arg) for arg in typing.get_args(annotation) if arg is not type(None)}
+        if len(members) == 1 and None not in members:
+            return members.pop()
+    return "string"
+
+
+def _parse_param_docs(doc: str) -> dict:
+    """Extracts `:param name: description` lines from a docstring in a single pass."""
+    param_docs = {}
+    pos, length = 0, len(doc)
+    while pos < length:
+        end = doc.find('\n', pos)
+        if end == -1:
+            end = length
+        while pos < end and doc[pos] in ' \t':
+            pos += 1
+        if doc.startswith(':param ', pos, end):
+            colon = doc.find(':', pos + 7, end)
+            if colon != -1:
+                # The name is the last word before the colon, which also covers `:param type name:`
+                name_start = doc.rfind(' ', pos, colon) + 1
+                param_docs[doc[name_start:colon]] = doc[colon + 1:end].strip()
+        pos = end + 1
+    return param_docs
+
+
 class LLMAgent(IAgent):
-    def __init__(self, robot_tools: RobotTools, api_url: str, api_key: Optional[str] = None, model: Optional[str] = None, debug_logging: bool = False):
+    def __init__(self, robot_tools: RobotTools, api_url: str, api_key: Optional[str] = None, model: Optional[str] = None, debug_logging: bool = False, stream: bool = False, prompt_cache: bool = False, cache_control: bool = False):
         if not api_url:
             raise ValueError("LLM_API_URL is required.")
         self.robot_tools = robot_tools
+        # Tool schemas are static for the lifetime of the agent, so reflect over RobotTools only once.
+        self._tool_definitions = self._get_tool_definitions()
+        # Providers with prompt caching (e.g. OpenAI's prompt_cache_key) route requests with the same key
+        # to the same cache, so the large static tools prefix is not reprocessed on every step.
+        self.prompt_cache = prompt_cache
+        self._tools_cache_key = hashlib.blake2b(orjson.dumps(self._tool_definitions), digest_size=16).hexdigest()
+        # Anthropic-style providers only cache up to an explicit cache_control breakpoint instead.
+        self.cache_control = cache_control
         self.api_url = self._resolve_llm_url(api_url)
         self.api_key = api_key
         self.model = model
         self.debug_logging = debug_logging
+        self.stream = stream
+        # API dicts of the last serialized conversation, extended incrementally on each step
+        self._api_source: List[AgentMessage] = []
+        self._api_messages: List[dict] = []
         self.system_prompt = self._build_system_prompt()
+        self._payload_prefix = self._build_payload_prefix(allow_tools=True)
+        self._payload_prefix_text_only = self._build_payload_prefix(allow_tools=False)
+
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        # A single pooled client keeps the connection alive between ReAct steps,
+        # so only the first request pays for the TCP+TLS handshake.
+        self._client = httpx.AsyncClient(
+            http2=_HTTP2_AVAILABLE,
+            verify=_ssl_context(),
+            headers=headers,
+            timeout=60,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0),
+        )
         print(f"[agent-config] LLM endpoint: {self.api_url}")
 
     def _resolve_llm_url(self, base_url: str) -> str:
@@ -35,39 +130,22 @@ class LLMAgent(IAgent):
     def _get_tool_definitions(self) -> List[dict]:
         """Inspects RobotTools and generates a JSON schema for each tool."""
         tools = []
-        for name, method in inspect.getmembers(self.robot_tools, predicate=inspect.iscoroutinefunction):
-            if name.startswith('_'):
-                continue
-            
+        for name in self.robot_tools.TOOLS:
+            method = getattr(self.robot_tools, name)
             doc = inspect.getdoc(method) or "No description."
             
-            # A simple parser for the docstring to extract param descriptions
-            param_docs = {}
-            if doc:
-                for line in doc.split('\n'):
-                    if line.strip().startswith(':param'):
-                        parts = line.strip().split(':', 2)
-                        if len(parts) == 3:
-                            param_name = parts[1].split(' ')[1]
-                            param_desc = parts[2].strip()
-                            param_docs[param_name] = param_desc
-
-            sig = inspect.signature(method)
+            param_docs = _parse_param_docs(doc)
+
+            # RobotTools uses postponed annotations, so evaluate them to get the real types back
+            sig = inspect.signature(method, eval_str=True)
             properties = {}
             required = []
             for param in sig.parameters.values():
                 if param.name == 'self':
                     continue
-                
-                param_type = "string"  # Default
-                if param.annotation is not inspect.Parameter.empty:
-                    # Convert annotation to string to handle forward references ('int' vs int)
-                    annotation_str = str(param.annotation)
-                    if 'int' in annotation_str or 'float' in annotation_str:
-                        param_type = "number"
-                    elif 'bool' in annotation_str:
-                        param_type = "boolean"
-                
+
+                param_type = _json_type(param.annotation)
+
                 properties[param.name] = {
                     "type": param_type,
                     "description": param_docs.get(param.name, "")
@@ -89,6 +167,19 @@ class LLMAgent(IAgent):
             })
         return tools
 
+    def _build_payload_prefix(self, allow_tools: bool) -> bytes:
+        """Encodes the request fields that never change, leaving the object open for the messages."""
+        # The tools stay in every request: providers reject a history with tool calls but no tools,
+        # and the cached prefix stays the same. A text-only answer is forced with tool_choice instead.
+        static_fields = {"model": self.model, "tools": self._tool_definitions}
+        if not allow_tools:
+            static_fields["tool_choice"] = "none"
+        if self.stream:
+            static_fields["stream"] = True
+        if self.prompt_cache:
+            static_fields["prompt_cache_key"] = self._tools_cache_key
+        return orjson.dumps(static_fields)[:-1] + b',"messages":'
+
     def _build_system_prompt(self) -> str:
         return """
 You are a helpful and brilliant robot control assistant. Your goal is to achieve the user's request by calling a sequence of available tools.
@@ -105,56 +196,146 @@ Do not ask the user for clarification. Infer any missing details from the contex
 Respond in the format specified by the user.
 """
 
-    async def run(self, messages: List[AgentMessage]) -> Result[AgentMessage]:
+    async def run(self, messages: Sequence[AgentMessage], allow_tools: bool = True) -> Result[AgentMessage]:
         """Runs a single step of the agent's reasoning loop."""
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
+        # A bounded history may have evicted the assistant message that a leading tool result answers;
+        # the API rejects such orphans, so they are left out.
+        orphans = 0
+        while orphans < len(messages) and messages[orphans].role == "tool":
+            orphans += 1
+        if orphans:
+            messages = list(messages)[orphans:]
 
         # Convert our AgentMessage format to the one expected by the LLM API
-        api_messages = [msg.to_dict() for msg in messages]
-
-        payload = {
-            "model": self.model,
-            "messages": api_messages,
-            "tools": self._get_tool_definitions(),
-        }
+        api_messages = self._serialize_messages(messages)
+        if self.cache_control:
+            api_messages = self._with_cache_breakpoint(api_messages)
 
+        raw_body = b""
         try:
+            # Only the messages change between steps; the static fields are pre-encoded once
+            prefix = self._payload_prefix if allow_tools else self._payload_prefix_text_only
+            body = prefix + orjson.dumps(api_messages) + b"}"
             if self.debug_logging:
-                print(f"[agent-debug] Sending payload to LLM: {json.dumps(payload, indent=2)}")
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(self.api_url, json=payload, headers=headers, timeout=60)
-                resp.raise_for_status()
-            
-            # Read raw bytes and decode manually to avoid any streaming issues
-            raw_text = resp.content.decode('utf-8')
+                # Log the exact bytes that go on the wire instead of serializing the payload a second time
+                print(f"[agent-debug] Sending payload to LLM: {body.decode()}")
+            if self.stream:
+                response_message = await self._read_stream(body)
+                return Result.ok(self._to_agent_message(response_message))
+
+            resp = await self._client.post(self.api_url, content=body)
+            resp.raise_for_status()
+
+            # orjson parses the raw bytes directly, no intermediate str is needed
+            raw_body = resp.content
             if self.debug_logging:
-                print(f"[agent-debug] Raw LLM response text: {raw_text}")
+                print(f"[agent-debug] Raw LLM response text: {raw_body.decode('utf-8', errors='replace')}")
 
-            if not raw_text:
+            if not raw_body:
                 return Result.err("llm_error", "LLM returned an empty response.")
 
-            data = json.loads(raw_text)
+            data = orjson.loads(raw_body)
             response_message = data.get("choices", [{}])[0].get("message", {})
 
-            # The LLM should respond with tool calls
-            if "tool_calls" in response_message and response_message["tool_calls"]:
-                tool_calls = []
-                for tc in response_message["tool_calls"]:
-                    args_str = tc["function"]["arguments"]
-                    try:
-                        args = json.loads(args_str) if args_str else {}
-                    except json.JSONDecodeError:
-                        print(f"[warn] Failed to decode tool arguments: {args_str}. Using empty args.")
-                        args = {}
-                    tool_calls.append(ToolCall(id=tc["id"], name=tc["function"]["name"], args=args))
-                return Result.ok(AgentMessage(role="assistant", content="", tool_calls=tool_calls))
-            else:
-                # If no tool call, it's a final answer
-                return Result.ok(AgentMessage(role="assistant", content=response_message.get("content")))
-
-        except json.JSONDecodeError as e:
-             return Result.err("llm_error", f"LLM API call failed: Failed to decode JSON. Error: {e}. Response: {raw_text}")
+            return Result.ok(self._to_agent_message(response_message))
+
+        except (json.JSONDecodeError, orjson.JSONDecodeError) as e:
+            raw_text = raw_body.decode('utf-8', errors='replace')
+            return Result.err("llm_error", f"LLM API call failed: Failed to decode JSON. Error: {e}. Response: {raw_text}")
         except Exception as e:
-            return Result.err("llm_error", f"LLM API call failed: {e}")
\ No newline at end of file
+            return Result.err("llm_error", f"LLM API call failed: {e}")
+
+    def _serialize_messages(self, messages: Sequence[AgentMessage]) -> List[dict]:
+        """Returns the API form of `messages`, converting only those appended since the previous call."""
+        done = len(self._api_source)
+        if done and (
+            done > len(messages)
+            or messages[0] is not self._api_source[0]
+            or messages[done - 1] is not self._api_source[-1]
+        ):
+            # A different or rewritten conversation, start over
+            self._api_source, self._api_messages = [], []
+            done = 0
+        for msg in itertools.islice(messages, done, None):
+            self._api_source.append(msg)
+            self._api_messages.append(msg.to_dict())
+        return self._api_messages
+
+    @staticmethod
+    def _with_cache_breakpoint(api_messages: List[dict]) -> List[dict]:
+        """
+        Returns the messages with an ephemeral cache_control breakpoint on the last user message,
+        so everything up to the current request is cached for the following steps.
+        Only one breakpoint is sent; it moves forward with each new request.
+        """
+        for i in range(len(api_messages) - 1, -1, -1):
+            msg = api_messages[i]
+            if msg["role"] == "user" and isinstance(msg.get("content"), str):
+                # The cached dicts are shared with the message history, so the marked one is a copy
+                marked = dict(msg, content=[{"type": "text", "text": msg["content"], "cache_control": {"type": "ephemeral"}}])
+                return api_messages[:i] + [marked] + api_messages[i + 1:]
+        return api_messages
+
+    async def _read_stream(self, body: bytes) -> dict:
+        """
+        Sends a streaming request and assembles the server-sent event deltas into a single message dict.
+        Each chunk is parsed as soon as it arrives, so decoding overlaps with the network transfer.
+        """
+        content_parts: List[str] = []
+        tool_calls: Dict[int, dict] = {}
+        async with self._client.stream("POST", self.api_url, content=body) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                if self.debug_logging:
+                    print(f"[agent-debug] LLM stream chunk: {data}")
+                try:
+                    chunk = orjson.loads(data)
+                except orjson.JSONDecodeError as e:
+                    # Report the chunk that failed, the response has no body to show in stream mode
+                    raise ValueError(f"Failed to decode JSON. Error: {e}. Response: {data}") from e
+                choices = chunk.get("choices") or [{}]
+                delta = choices[0].get("delta") or {}
+                if delta.get("content"):
+                    content_parts.append(delta["content"])
+                # Tool call fragments are keyed by index: the first one carries id and name,
+                # the following ones append pieces of the JSON arguments string.
+                for tc_delta in delta.get("tool_calls") or []:
+                    tc = tool_calls.setdefault(tc_delta.get("index", 0), {"id": "", "function": {"name": "", "arguments": ""}})
+                    if tc_delta.get("id"):
+                        tc["id"] = tc_delta["id"]
+                    function = tc_delta.get("function") or {}
+                    if function.get("name"):
+                        tc["function"]["name"] = function["name"]
+                    if function.get("arguments"):
+                        tc["function"]["arguments"] += function["arguments"]
+
+        message = {"content": "".join(content_parts) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        return message
+
+    def _to_agent_message(self, response_message: dict) -> AgentMessage:
+        """Converts an API response message into an AgentMessage."""
+        # The LLM should respond with tool calls
+        if "tool_calls" in response_message and response_message["tool_calls"]:
+            tool_calls = []
+            for tc in response_message["tool_calls"]:
+                args_str = tc["function"]["arguments"]
+                try:
+                    args = orjson.loads(args_str) if args_str else {}
+                except orjson.JSONDecodeError:
+                    print(f"[warn] Failed to decode tool arguments: {args_str}. Using empty args.")
+                    args = {}
+                tool_calls.append(ToolCall(id=tc["id"], name=tc["function"]["name"], args=args))
+            return AgentMessage(role="assistant", content="", tool_calls=tool_calls)
+        # If no tool call, it's a final answer
+        return AgentMessage(role="assistant", content=response_message.get("content"))
+
+    async def aclose(self) -> None:
+        """Closes the pooled HTTP client and its open connections."""
+        await self._client.aclose()
@@ -1,7 +1,7 @@
 """Base protocols for ReAct-style agents."""
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Sequence
 from core.types import AgentMessage, Result
 
 
@@ -9,10 +9,11 @@ class IAgent(ABC):
     """Abstract interface for a ReAct agent."""
 
     @abstractmethod
-    async def run(self, messages: List[AgentMessage]) -> Result[AgentMessage]:
+    async def run(self, messages: Sequence[AgentMessage], allow_tools: bool = True) -> Result[AgentMessage]:
         """
         Runs a single step of the agent's reasoning loop.
         :param messages: The history of the conversation and actions.
+        :param allow_tools: Whether the agent may call tools; if False it must answer with text.
         :return: The agent's next message, containing thoughts and/or tool calls.
         """
         ...
\ No newline at end of file
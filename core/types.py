@@ -2,14 +2,15 @@
 All implementations are stubs; replace NotImplementedError with real logic.
 """
 from __future__ import annotations
-import json
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 from typing import Generic, List, Optional, Protocol, TypeVar, Union, Callable
 
+import orjson
+
 T = TypeVar("T")
 
 
-@dataclass
+@dataclass(slots=True)
 class Error:
     code: str
     message: str
@@ -20,6 +21,8 @@ class Result(Generic[T]):
     ok: bool
     data: Optional[T] = None
     error: Optional[Error] = None
+    # Cached results are reported to the agent repeatedly, so their JSON form is built only once.
+    _data_json: Optional[str] = field(default=None, compare=False, repr=False)
 
     @classmethod
     def ok(cls, data: T) -> Result[T]:
@@ -29,8 +32,25 @@ class Result(Generic[T]):
     def err(cls, code: str, message: str) -> Result[T]:
         return cls(ok=False, error=Error(code=code, message=message))
 
-
-@dataclass
+    def data_json(self) -> str:
+        """Serializes `data` to compact JSON for the agent."""
+        if self._data_json is None:
+            data = self.data
+            data_type = type(data)
+            # Scalars need no encoder; a string goes out as is, since the tool message content is text anyway
+            if data is None:
+                self._data_json = "null"
+            elif data_type is str:
+                self._data_json = data
+            elif data_type is int:
+                self._data_json = str(data)
+            else:
+                to_dict = _TO_DICT.get(data_type)
+                self._data_json = orjson.dumps(to_dict(data) if to_dict is not None else data).decode()
+        return self._data_json
+
+
+@dataclass(slots=True)
 class Pose:
     x: float
     y: float
@@ -41,18 +61,18 @@ class Pose:
     frame: str = "base"
 
     def to_dict(self):
-        return asdict(self)
+        return {"x": self.x, "y": self.y, "z": self.z, "rx": self.rx, "ry": self.ry, "rz": self.rz, "frame": self.frame}
 
 
-@dataclass
+@dataclass(slots=True)
 class Joints:
     values: List[float]
 
     def to_dict(self):
-        return asdict(self)
+        return {"values": list(self.values)}
 
 
-@dataclass
+@dataclass(slots=True)
 class RobotState:
     joints: Optional[Joints] = None
     tcp: Optional[Pose] = None
@@ -60,35 +80,44 @@ class RobotState:
     error: Optional[Error] = None
 
     def to_dict(self):
-        return asdict(self)
+        return {
+            "joints": self.joints.to_dict() if self.joints is not None else None,
+            "tcp": self.tcp.to_dict() if self.tcp is not None else None,
+            "mode": self.mode,
+            "error": {"code": self.error.code, "message": self.error.message} if self.error is not None else None,
+        }
 
 
-@dataclass
+# Tool result types with a custom API form; anything else is handed to orjson as is.
+_TO_DICT = {Pose: Pose.to_dict, Joints: Joints.to_dict, RobotState: RobotState.to_dict}
+
+
+@dataclass(slots=True)
 class MoveHandle:
     handle_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Intent:
     type: str
     params: Optional[dict] = None
     requires_confirmation: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class ExecutionReport:
     status: str
     detail: Optional[str] = None
     result: Optional[dict] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Event:
     name: str
     payload: dict
 
 
-@dataclass
+@dataclass(slots=True)
 class DialogContext:
     history: list = None
     state: Optional[RobotState] = None
@@ -102,6 +131,7 @@ class ILogger(Protocol):
 
 class IStateCache(Protocol):
     def get(self) -> RobotState: ...
+    def get_json(self) -> str: ...
     def set(self, state: RobotState) -> None: ...
 
 
@@ -109,18 +139,19 @@ ModeContext = dict
 
 
 # Callable aliases
-TextCallback = Callable[[str], None]
+# Receives the recognized text and the time.monotonic() at which the phrase started
+TextCallback = Callable[[str, float], None]
 
 
 # --- ReAct Agent Types ---
 
-@dataclass
+@dataclass(slots=True)
 class ToolCall:
     id: str
     name: str
     args: dict
 
-@dataclass
+@dataclass(slots=True)
 class AgentMessage:
     role: str  # "user", "assistant", "tool"
     content: Optional[str] = None
@@ -128,9 +159,16 @@ class AgentMessage:
     tool_calls: Optional[List[ToolCall]] = None
     tool_call_id: Optional[str] = None
     name: Optional[str] = None # For non-standard APIs like polza.ai
+    # Messages are not modified once added to the history, so their API form is built only once.
+    _cached: Optional[dict] = field(default=None, compare=False, repr=False)
 
     def to_dict(self):
         """Serializes the message to a dictionary for LLM API consumption."""
+        if self._cached is None:
+            self._cached = self._build_dict()
+        return self._cached
+
+    def _build_dict(self):
         d = {"role": self.role}
         
         # Only add content if it's not None
@@ -139,7 +177,7 @@ class AgentMessage:
 
         if self.tool_calls:
             d["tool_calls"] = [
-                {"type": "function", "id": tc.id, "function": {"name": tc.name, "arguments": json.dumps(tc.args)}}
+                {"type": "function", "id": tc.id, "function": {"name": tc.name, "arguments": orjson.dumps(tc.args).decode()}}
                 for tc in self.tool_calls
             ]
         if self.tool_call_id:
@@ -5,6 +5,8 @@ from core.types import Joints, MoveHandle, Pose, Result
 
 
 class IRobotDriver(Protocol):
+    # Drivers that can tell whether a goal is still being executed may also provide
+    # `async def is_moving(self) -> Result[bool]`; RobotTools.move_p2p only skips a move when it says False.
     async def read_joints(self) -> Result[Joints]: ...
     async def command_joint_goal(self, joints: Joints, speed: float, accel: float) -> Result[MoveHandle]: ...
     async def command_cartesian_goal(self, pose: Pose, speed: float, accel: float, frame: str = "base") -> Result[MoveHandle]: ...
@@ -12,5 +14,5 @@ class IRobotDriver(Protocol):
 
 
 class IServo(Protocol):
-    def set_angle(self, angle: int) -> bool: ...
+    async def set_angle(self, angle: int) -> bool: ...
     def close(self): ...
@@ -1,4 +1,6 @@
+import asyncio
 import serial
+from concurrent.futures import ThreadPoolExecutor
 import time
 import serial.tools.list_ports
 from .base import IServo
@@ -17,6 +19,9 @@ class ServoController(IServo):
             port = self._find_arduino_port()
             
         self.ser = serial.Serial(port, baudrate, timeout=timeout)
+        # Отдельный поток для порта: команды не ждут в общем пуле за чужими задачами
+        # и выполняются строго по очереди, не перемешиваясь в последовательном порту
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servo-io")
         time.sleep(2)  # Ожидание инициализации Arduino
         print(f"Подключено к {port}")
         
@@ -33,7 +38,7 @@ class ServoController(IServo):
         
         raise Exception("Arduino не найден. Укажите порт вручную.")
     
-    def set_angle(self, angle: int) -> bool:
+    async def set_angle(self, angle: int) -> bool:
         """
         Установка угла сервопривода
         
@@ -44,12 +49,16 @@ class ServoController(IServo):
             print(f"Ошибка: угол {angle} вне диапазона 0-180")
             return False
         
-        command = f"{angle}\n"
-        self.ser.write(command.encode())
-        
-        response = self._read_response()
+        # Запись и чтение порта блокирующие (до timeout), поэтому выполняются вне цикла событий
+        response = await asyncio.get_running_loop().run_in_executor(self._io_executor, self._send_angle, angle)
         print(f"Установлен угол: {angle}° - {response}")
         return True
+
+    def _send_angle(self, angle: int) -> str:
+        """Отправка команды и ожидание ответа от Arduino"""
+        command = f"{angle}\n"
+        self.ser.write(command.encode())
+        return self._read_response()
     
     def _read_response(self) -> str:
         """Чтение ответа от Arduino"""
@@ -61,6 +70,7 @@ class ServoController(IServo):
 
     def close(self):
         """Закрытие соединения"""
+        self._io_executor.shutdown(wait=True)
         if self.ser and self.ser.is_open:
             self.ser.close()
             print("Соединение с сервоприводом закрыто")
@@ -73,14 +83,14 @@ class MockServo(IServo):
     def __init__(self, port: str | None = None, **kwargs):
         print("Инициализирован мок-сервопривод")
 
-    def set_angle(self, angle: int) -> bool:
+    async def set_angle(self, angle: int) -> bool:
         if not 0 <= angle <= 180:
             print(f"Ошибка (Мок): угол {angle} вне диапазона 0-180")
             return False
         
         print(f"Мок: Установлен угол: {angle}°")
         # Имитация небольшой задержки
-        time.sleep(0.1)
+        await asyncio.sleep(0.1)
         return True
 
     def close(self):
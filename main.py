@@ -13,10 +13,11 @@ from dotenv import load_dotenv
 
 
 import asyncio
+import logging
 import sys
 from core.types import RobotState
 from voice.asr import SpeechRecognitionInput
-from voice.tts import GTTSOutput, ConsoleOutput
+from voice.tts import IVoiceOutput, GTTSOutput, ConsoleOutput, PiperOutput
 from modes.base import ModeManager
 from modes.llm_mode import LLMMode
 from skills.executor import SkillExecutor
@@ -24,6 +25,7 @@ from agents.agent import LLMAgent
 from tools.robot_tools import RobotTools
 from safety.base import ISafetyRules
 from state.cache import StateCache
+from state.logger import setup_logging
 from drivers.base import IRobotDriver, IServo
 from drivers.servo_driver import ServoController, MockServo
 from kinematics.base import IKinematics
@@ -75,6 +77,7 @@ async def main():
     """
     print("Starting voice-controlled manipulator application...")
     load_dotenv()
+    log_listener = setup_logging(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
 
     # --- 1. Load Configuration ---
     llm_api_url = os.getenv("LLM_API_URL")
@@ -82,9 +85,20 @@ async def main():
     llm_model = os.getenv("LLM_MODEL")
     mic_index_raw = os.getenv("MIC_DEVICE_INDEX")
     mic_device_index = int(mic_index_raw) if mic_index_raw is not None else None
+    vad_level_raw = os.getenv("ASR_VAD_LEVEL")
+    asr_vad_level = int(vad_level_raw) if vad_level_raw else None
+    whisper_model = os.getenv("WHISPER_MODEL") or None
     tts_enabled = os.getenv("TTS_ENABLED", "true").lower() == "true"
+    tts_engine = os.getenv("TTS_ENGINE", "gtts").lower()
+    piper_model = os.getenv("PIPER_MODEL")
+    tts_cache_dir = os.getenv("TTS_CACHE_DIR")
+    # Passed on only when set, GTTSOutput owns the default location
+    gtts_options = {"cache_dir": tts_cache_dir} if tts_cache_dir else {}
     servo_enabled = os.getenv("SERVO_ENABLED", "false").lower() == "true"
     llm_debug_logging = os.getenv("LLM_DEBUG_LOGGING", "false").lower() == "true"
+    llm_stream = os.getenv("LLM_STREAM", "false").lower() == "true"
+    llm_prompt_cache = os.getenv("LLM_PROMPT_CACHE", "false").lower() == "true"
+    llm_cache_control = os.getenv("LLM_CACHE_CONTROL", "false").lower() == "true"
     servo_port = os.getenv("SERVO_PORT") or None
 
     if not llm_api_url:
@@ -93,9 +107,22 @@ async def main():
 
     # --- 2. Initialize Architectural Components ---
     
-    voice_input = SpeechRecognitionInput(mic_device_index=mic_device_index)
-    if tts_enabled:
-        voice_output = GTTSOutput()
+    voice_input = SpeechRecognitionInput(
+        mic_device_index=mic_device_index,
+        vad_aggressiveness=asr_vad_level,
+        whisper_model=whisper_model,
+    )
+    voice_output: IVoiceOutput
+    if tts_enabled and tts_engine == "piper":
+        try:
+            print(f"[config] Local Piper TTS is enabled (Model: {piper_model}).")
+            voice_output = PiperOutput(model_path=piper_model)
+        except Exception as e:
+            print(f"[error] Failed to initialize Piper TTS: {e}")
+            print("[config] Falling back to gTTS.")
+            voice_output = GTTSOutput(**gtts_options)
+    elif tts_enabled:
+        voice_output = GTTSOutput(**gtts_options)
     else:
         print("[config] TTS is disabled. Using console output.")
         voice_output = ConsoleOutput()
@@ -131,6 +158,9 @@ async def main():
         api_key=llm_api_key,
         model=llm_model,
         debug_logging=llm_debug_logging,
+        stream=llm_stream,
+        prompt_cache=llm_prompt_cache,
+        cache_control=llm_cache_control,
     )
     skill_executor = SkillExecutor(robot_tools=robot_tools, state_cache=state_cache)
 
@@ -165,7 +195,7 @@ async def main():
     # --- 5. Start Application ---
     main_task = None
     try:
-        print("Switching to LLM mode. Press Enter to start listening, Ctrl+C to exit.")
+        print("Switching to LLM mode. Speak a command, Ctrl+C to exit.")
         await mode_manager.switch("llm")
         
         current_mode = mode_manager.get_current_mode()
@@ -189,8 +219,12 @@ async def main():
         # Clean up servo connection
         if servo_driver:
             servo_driver.close()
+
+        # Close the pooled LLM HTTP connections
+        await agent.aclose()
             
         print("Goodbye!")
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,22 +1,80 @@
 """LLM-driven control mode that uses a ReAct agent for complex tasks."""
 from __future__ import annotations
 import asyncio
-import json
-import re
-from typing import List
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import orjson
 
 from agents.base import IAgent
-from core.types import AgentMessage, ModeContext
+from core.types import AgentMessage, ModeContext, Result, ToolCall
 from modes.base import IControlMode
 from skills.executor import ISkillExecutor
 from voice.asr import IVoiceInput
 from voice.tts import IVoiceOutput
 
+_log = logging.getLogger(__name__)
+
+
+class _TTSCharTable(dict):
+    """
+    A str.translate table that keeps Cyrillic, Latin, numbers, whitespace, and basic punctuation;
+    everything else, including emojis, is removed. Characters outside the table are classified on first sight.
+    """
+
+    def __missing__(self, codepoint: int):
+        kept = codepoint if chr(codepoint).isspace() else None
+        self[codepoint] = kept
+        return kept
+
+
+_TTS_CHARS = _TTSCharTable(
+    (ord(c), ord(c))
+    for c in "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789.,!?='-"
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+)
+
+
+def _tool_result_to_message(tool_call: ToolCall, result: Union[Result, Exception]) -> Tuple[AgentMessage, bool]:
+    """Builds the tool message for a result; also returns whether the tool failed."""
+    if isinstance(result, Exception):
+        content = f"Error executing tool: {result}"
+        failed = True
+    elif result.ok:
+        content = result.data_json()
+        failed = False
+    else:
+        content = f"Error: {result.error.message}"
+        failed = True
+
+    # A tool message includes the 'name' for polza.ai compatibility
+    return AgentMessage(role="tool", content=content, tool_call_id=tool_call.id, name=tool_call.name), failed
+
 
 class LLMMode(IControlMode):
     """
     A control mode that uses a ReAct agent to interact with the user and the robot.
     """
+    # Side-effect-free tools that are safe to run ahead of the agent asking for them.
+    READONLY_TOOLS = frozenset({"get_joint_positions", "get_tcp_pose", "get_state"})
+    # Tools that make the robot move; after them the user hears FILLER_PHRASE while the agent decides what's next.
+    MOTION_TOOLS = frozenset({"move_p2p", "set_gripper", "set_servo_angle"})
+    FILLER_PHRASE = "Выполняю..."
+    EXIT_PHRASE = "Режим агента выключен."
+    # Upper bound on agent calls per user request
+    MAX_STEPS = 10
+    # Once the history grows past MAX_HISTORY messages, all but the most recent HISTORY_KEEP are summarized.
+    MAX_HISTORY = 40
+    HISTORY_KEEP = 20
+    # Hard cap on stored messages, in case a single request produces more than the summary can catch
+    HISTORY_MAXLEN = 200
+    SUMMARY_PROMPT = (
+        "Summarize the conversation above in a few sentences for your own future reference: "
+        "the user's requests, what was done, and the robot state you last observed. Do not call any tools."
+    )
+
     def __init__(
         self,
         agent: IAgent,
@@ -32,122 +90,301 @@ class LLMMode(IControlMode):
         self.max_retries = max_retries
         self.ctx: ModeContext = {}
         self._is_running = False
-        self.history: List[AgentMessage] = []
+        self._busy = False
+        # When the last request was finished; phrases that started earlier overlapped the robot's own speech
+        self._idle_since = 0.0
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._requests: asyncio.Queue[str] = asyncio.Queue()
+        self.history: Deque[AgentMessage] = deque(maxlen=self.HISTORY_MAXLEN)
 
     async def enter(self, ctx: ModeContext) -> None:
         self.ctx = ctx
         self._is_running = True
-        print("[mode] Entered LLMMode.")
+        _log.info("Entered LLMMode.")
+        # Prepare the fixed phrases while the greeting plays, so they are ready when needed
+        self._warm_up_task = asyncio.create_task(self.voice_out.warm_up((self.FILLER_PHRASE, self.EXIT_PHRASE)))
         await self.voice_out.speak("Режим агента активирован.")
 
     def _clean_text_for_tts(self, text: str) -> str:
         """Removes special characters, markdown, and emojis to make the text safe for TTS."""
-        # This regex keeps Cyrillic, Latin, numbers, spaces, and basic punctuation.
-        # It removes everything else, including emojis.
-        cleaned_text = re.sub(r"[^a-zA-Zа-яА-Я0-9\s.,!?='\-]", '', text)
-        return cleaned_text.strip()
-
-    async def _run_agent_loop(self, initial_request: str):
-        """Manages the ReAct loop with retries: User -> Agent -> Tools -> Agent -> User."""
-        self.history.append(AgentMessage(role="user", content=initial_request))
-
-        # This is the main ReAct step loop. It continues as long as the agent
-        # produces tool calls. It will be broken internally by a `return` statement
-        # when the agent gives a final answer. We add a safety break after 10 steps.
-        for _ in range(10): # Max 10 steps
-            # 1. Get next action from agent
-            agent_response_res = await self.agent.run(self.history)
-            if not agent_response_res.ok:
-                await self.voice_out.speak(f"Ошибка агента: {agent_response_res.error.message}")
-                return
-
-            agent_message = agent_response_res.data
-            self.history.append(agent_message)
-
-            # 2. If agent provided a final answer, the loop is over.
-            if agent_message.content:
-                cleaned_response = self._clean_text_for_tts(agent_message.content)
-                await self.voice_out.speak(cleaned_response)
-                return
-
-            # 3. If no tool calls, but also no content, something is wrong.
-            if not agent_message.tool_calls:
-                await self.voice_out.speak("Агент не вернул ни ответа, ни команды. Завершаю задачу.")
-                return
-
-            # 4. Check for shutdown command before execution
-            for tc in agent_message.tool_calls:
-                if tc.name == "shutdown":
-                    print("[mode] Shutdown command received from agent.")
-                    await self.voice_out.speak(tc.args.get("reason", "Завершаю работу по команде."))
-                    self.stop_loop()
+        return text.translate(_TTS_CHARS).strip()
+
+    async def _run_agent_loop(
+        self,
+        initial_request: str,
+        history: Optional[Deque[AgentMessage]] = None,
+        pace: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        """
+        Manages the ReAct loop with retries: User -> Agent -> Tools -> Agent -> User.
+        :param history: The conversation to continue, defaults to the mode's own history.
+        :param pace: Awaited before every agent call, e.g. to share a rate limit between conversations.
+        """
+        if history is None:
+            history = self.history
+        history.append(AgentMessage(role="user", content=initial_request))
+
+        prefetched: Dict[tuple, asyncio.Task] = {}
+        filler: Optional[asyncio.Task] = None
+        try:
+            # This is the main ReAct step loop. It continues as long as the agent
+            # produces tool calls. It will be broken internally by a `return` statement
+            # when the agent gives a final answer. We add a safety break after MAX_STEPS steps.
+            for step in range(self.MAX_STEPS):
+                # 1. Get next action from agent. The last allowed step may not call tools,
+                # so the agent has to summarize in text instead of the loop ending silently.
+                final_step = step == self.MAX_STEPS - 1
+                if pace is not None:
+                    await pace()
+                agent_response_res = await self.agent.run(history, allow_tools=not final_step)
+                if filler is not None:
+                    # Let the filler finish, so it doesn't talk over the next phrase
+                    await filler
+                    filler = None
+                if not agent_response_res.ok:
+                    await self._say(history, f"Ошибка агента: {agent_response_res.error.message}")
                     return
 
-            # 5. Execute tools
-            tool_tasks = [self.skill_executor.execute_tool_call(tc) for tc in agent_message.tool_calls]
-            tool_results = await asyncio.gather(*tool_tasks, return_exceptions=True)
-
-            # 6. Append tool results to history and check for errors
-            has_errors = False
-            for i, result in enumerate(tool_results):
-                tool_call = agent_message.tool_calls[i]
-                
-                content = ""
-                if isinstance(result, Exception):
-                    content = f"Error executing tool: {result}"
-                    has_errors = True
-                else:
-                    if result.ok:
-                        if hasattr(result.data, 'to_dict'):
-                            content = json.dumps(result.data.to_dict(), indent=2)
-                        else:
-                            content = json.dumps(result.data)
-                    else:
-                        content = f"Error: {result.error.message}"
-                        has_errors = True
-                
-                # Append a tool message that includes the 'name' for polza.ai compatibility
-                self.history.append(AgentMessage(
-                    role="tool",
-                    content=content,
-                    tool_call_id=tool_call.id,
-                    name=tool_call.name
-                ))
-            
-            # 7. If there were errors, we will loop again and let the agent see them.
-            # No special retry logic needed here, the main loop serves this purpose.
-            if has_errors:
-                print(f"[agent] A tool execution failed. The agent will be notified.")
+                agent_message = agent_response_res.data
+                history.append(agent_message)
+
+                # 2. If agent provided a final answer, the loop is over.
+                if agent_message.content:
+                    cleaned_response = self._clean_text_for_tts(agent_message.content)
+                    await self._say(history, cleaned_response)
+                    return
+
+                # 3. If no tool calls, but also no content, something is wrong.
+                if not agent_message.tool_calls:
+                    await self._say(history, "Агент не вернул ни ответа, ни команды. Завершаю задачу.")
+                    return
 
+                # 4. Check for shutdown command before execution
+                for tc in agent_message.tool_calls:
+                    if tc.name == "shutdown":
+                        _log.info("Shutdown command received from agent.")
+                        await self._say(history, tc.args.get("reason", "Завершаю работу по команде."))
+                        # Only the interactive conversation may stop the mode; batch runs just end.
+                        if history is self.history:
+                            self.stop_loop()
+                        return
 
+                # 5. Execute tools, reusing reads that were prefetched during the agent call.
+                # Identical reads in one response are executed once and share the result; every other call
+                # runs on its own, since repeating a command can matter (e.g. servo to 30, 60, then 30 again).
+                call_keys = [
+                    self._tool_key(tc) if tc.name in self.READONLY_TOOLS else (i,)
+                    for i, tc in enumerate(agent_message.tool_calls)
+                ]
+                tool_tasks: Dict[tuple, Awaitable] = {}
+                for key, tc in zip(call_keys, agent_message.tool_calls):
+                    if key not in tool_tasks:
+                        tool_tasks[key] = prefetched.pop(key, None) or self.skill_executor.execute_tool_call(tc)
+                self._cancel_prefetched(prefetched)
+
+                # 6. Convert each result as soon as its tool finishes, so fast tools don't wait for slow ones.
+                # The messages are appended in the order of the tool calls, as the LLM APIs expect.
+                # The TaskGroup also cancels every running tool if this loop itself is cancelled.
+                tool_messages: List[Optional[AgentMessage]] = [None] * len(call_keys)
+                has_errors = False
+                async with asyncio.TaskGroup() as tg:
+                    running = [tg.create_task(self._safe_exec(key, task)) for key, task in tool_tasks.items()]
+                    for next_done in asyncio.as_completed(running):
+                        key, result = await next_done
+                        for i, call_key in enumerate(call_keys):
+                            if call_key == key:
+                                tool_messages[i], failed = _tool_result_to_message(agent_message.tool_calls[i], result)
+                                has_errors = has_errors or failed
+                history.extend(tool_messages)
+
+                # 7. If there were errors, we will loop again and let the agent see them.
+                # No special retry logic needed here, the main loop serves this purpose.
+                if has_errors:
+                    _log.warning("A tool execution failed. The agent will be notified.")
+
+                # 8. Speculatively repeat the read-only calls while the agent thinks about the next step;
+                # if it asks for the same reads again, their results are already on the way.
+                # After motion the robot may still be moving, so a read taken now would be stale when asked for.
+                moved = any(tc.name in self.MOTION_TOOLS for tc in agent_message.tool_calls)
+                if not moved:
+                    for key, tc in zip(call_keys, agent_message.tool_calls):
+                        if tc.name in self.READONLY_TOOLS and key not in prefetched:
+                            prefetched[key] = asyncio.create_task(self.skill_executor.execute_tool_call(tc))
+
+                # 9. Motion takes a while to report on, so say something instead of staying silent
+                # while the agent runs. Batch conversations have no listener.
+                if history is self.history and moved:
+                    filler = asyncio.create_task(self.voice_out.speak(self.FILLER_PHRASE))
+        finally:
+            self._cancel_prefetched(prefetched)
+            if filler is not None:
+                filler.cancel()
+
+    async def _say(self, history: Deque[AgentMessage], text: str) -> None:
+        """Speaks to the user of the interactive conversation; batch conversations have no listener and are only logged."""
+        if history is self.history:
+            await self.voice_out.speak(text)
+        else:
+            _log.info("Batch conversation: %s", text)
+
+    async def _compact_history(self, history: Deque[AgentMessage]) -> None:
+        """
+        Replaces the older part of the history with a summary written by the agent,
+        so the prompt stops growing with every request. Called between requests only, after the answer was spoken.
+        """
+        # Cut at a user message, so no tool result is separated from the call that produced it
+        cut = next(
+            (i for i in range(len(history) - self.HISTORY_KEEP, len(history)) if history[i].role == "user"),
+            None,
+        )
+        if not cut:
+            return
+        evicted = [history.popleft() for _ in range(cut)]
+
+        summary_res = await self.agent.run(
+            evicted + [AgentMessage(role="user", content=self.SUMMARY_PROMPT)], allow_tools=False
+        )
+        if summary_res.ok and summary_res.data.content:
+            history.appendleft(AgentMessage(role="system", content=f"Summary of the earlier conversation: {summary_res.data.content}"))
+        else:
+            _log.warning("Could not summarize %d old messages, dropping them.", cut)
+
+    @staticmethod
+    async def _safe_exec(key: tuple, awaitable) -> tuple:
+        """
+        Awaits a tool execution and tags its result (or exception) with the tool call's key.
+        Exceptions are returned rather than raised, so one failing tool doesn't cancel the others in the TaskGroup.
+        """
+        try:
+            return key, await awaitable
+        except Exception as e:
+            return key, e
+
+    @staticmethod
+    def _tool_key(tool_call: ToolCall) -> tuple:
+        """Identifies a tool call by its name and canonical arguments."""
+        return tool_call.name, orjson.dumps(tool_call.args, option=orjson.OPT_SORT_KEYS)
+
+    @staticmethod
+    def _cancel_prefetched(prefetched: Dict[tuple, asyncio.Task]) -> None:
+        """Cancels the speculative reads that the agent did not ask for."""
+        for task in prefetched.values():
+            task.cancel()
+        prefetched.clear()
+
+    async def run_batch(self, requests: List[str], qpm: int = 60, max_concurrency: int = 8) -> List[Deque[AgentMessage]]:
+        """
+        Runs several independent conversations concurrently, e.g. for offline evaluation of canned prompts.
+        :param requests: The user requests, each one starts its own conversation.
+        :param qpm: The maximum number of agent calls per minute, shared by all conversations.
+        :param max_concurrency: The maximum number of conversations running at the same time.
+        :return: The history of every conversation, in the order of `requests`.
+        """
+        if qpm <= 0 or max_concurrency <= 0:
+            raise ValueError("qpm and max_concurrency must be positive.")
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        histories: List[Deque[AgentMessage]] = [deque(maxlen=self.HISTORY_MAXLEN) for _ in requests]
+        loop = asyncio.get_running_loop()
+        interval = 60 / qpm
+        next_slot = loop.time()
+
+        async def pace():
+            # Every conversation makes several agent calls, so the calls themselves are spaced evenly:
+            # each one takes the next free slot, which keeps the provider's request rate under `qpm`.
+            nonlocal next_slot
+            now = loop.time()
+            delay = next_slot - now
+            next_slot = max(next_slot, now) + interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        async def run_one(request: str, history: Deque[AgentMessage]):
+            async with semaphore:
+                await self._run_agent_loop(request, history, pace=pace)
+
+        # The TaskGroup cancels and awaits the remaining conversations if one of them fails.
+        async with asyncio.TaskGroup() as tg:
+            for request, history in zip(requests, histories):
+                tg.create_task(run_one(request, history))
+        return histories
 
     async def run_interactive_loop(self):
-        """The main interactive loop for this mode."""
-        while self._is_running:
-            try:
-                # This input call is blocking, which is not ideal in an async app,
-                # but for a console PoC it's acceptable to signal the start of listening.
-                await asyncio.to_thread(input, "\nPress Enter and start speaking...")
-                
-                user_text = await self.voice_in.listen_once()
-                if not user_text:
-                    continue
-                
-                # Start the agent loop for this request
-                await self._run_agent_loop(user_text)
-
-            except (KeyboardInterrupt, asyncio.CancelledError):
-                print("\nInteractive loop interrupted.")
-                self.stop_loop()
-            except Exception as e:
-                print(f"[error] An error occurred in the interactive loop: {e}")
-                await self.voice_out.speak("Произошла системная ошибка.")
+        """
+        The main interactive loop for this mode. The microphone stays on in the background
+        and every recognized phrase becomes a request for the agent.
+        """
+        self.voice_in.on_text(self._on_voice_text)
+        listener = asyncio.create_task(self.voice_in.start())
+        listener.add_done_callback(self._on_listener_done)
+        _log.info("Listening... Speak a command, Ctrl+C to exit.")
+        compaction: Optional[asyncio.Task] = None
+        try:
+            while self._is_running:
+                try:
+                    user_text = await self._requests.get()
+                    if not user_text:
+                        continue
+
+                    # Start the agent loop for this request
+                    self._busy = True
+                    try:
+                        if compaction is not None:
+                            # The summary of the earlier requests usually lands while the user is still talking
+                            await compaction
+                            compaction = None
+                        await self._run_agent_loop(user_text)
+                    except Exception as e:
+                        _log.error("An error occurred in the interactive loop: %s", e)
+                        await self.voice_out.speak("Произошла системная ошибка.")
+                    finally:
+                        # Stamped after the last phrase was spoken, so it covers the error message too
+                        self._busy = False
+                        self._idle_since = time.monotonic()
+
+                    # Summarize the old part of the history in the background, so the user doesn't wait for it
+                    if compaction is None and len(self.history) > self.MAX_HISTORY:
+                        compaction = asyncio.create_task(self._compact_history(self.history))
+
+                except (KeyboardInterrupt, asyncio.CancelledError):
+                    _log.info("Interactive loop interrupted.")
+                    self.stop_loop()
+        finally:
+            if compaction is not None:
+                compaction.cancel()
+            listener.cancel()
+            await self.voice_in.stop()
+
+    def _on_listener_done(self, listener: asyncio.Task) -> None:
+        """Stops the loop if voice input ends on its own, e.g. when the microphone cannot be opened."""
+        if listener.cancelled():
+            return
+        error = listener.exception()
+        if error is not None:
+            _log.error("Voice input failed: %s", error)
+        elif self._is_running:
+            _log.warning("Voice input stopped, no more commands can be heard.")
+        self.stop_loop()
+
+    def _on_voice_text(self, text: str, started_at: float) -> None:
+        """
+        Queues recognized speech as the next request.
+        :param started_at: The time.monotonic() at which the phrase started.
+        """
+        # A phrase is transcribed only after it ends, so checking _busy alone would let through speech
+        # that started while the agent was working, including the robot's own answer.
+        if self._busy or started_at < self._idle_since:
+            _log.info("Heard while busy, ignoring: %s", text)
+            return
+        self._requests.put_nowait(text)
 
     def stop_loop(self):
         """Signals the interactive loop to stop."""
         if self._is_running:
-            print("[mode] Stopping interactive loop...")
+            _log.info("Stopping interactive loop...")
             self._is_running = False
+            # Wake the loop if it is waiting for speech
+            self._requests.put_nowait("")
 
     async def handle_event(self, event) -> None:
         pass
@@ -156,7 +393,10 @@ class LLMMode(IControlMode):
         pass
 
     async def exit(self) -> None:
-        print("[mode] Exiting LLMMode.")
+        _log.info("Exiting LLMMode.")
         self.stop_loop() # Ensure loop is stopped on exit
-        await self.voice_out.speak("Режим агента выключен.")
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+            self._warm_up_task = None
+        await self.voice_out.speak(self.EXIT_PHRASE)
 
@@ -1,13 +1,32 @@
 """Skill executor that maps intents to robot tool calls."""
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import Callable, Any, Dict
+from typing import Callable, Any, Dict, Final
 
 import asyncio
+import logging
+import orjson
 from core.types import ExecutionReport, Intent, Result, ToolCall
 from tools.robot_tools import RobotTools
 from state.cache import StateCache
 
+_log = logging.getLogger(__name__)
+
+# Maps intent types to the names of the RobotTools methods that implement them.
+_SKILL_NAMES: Final = (
+    ("get_tcp_pose", "get_tcp_pose"),
+    ("get_joint_positions", "get_joint_positions"),
+    ("get_state", "get_state"),
+    ("move_p2p", "move_p2p"),
+    ("move_p2p_pose", "move_p2p"),
+    ("move_p2p_joints", "move_p2p"),
+    ("set_gripper", "set_gripper"),
+    ("stop", "stop"),
+    ("run_fk", "run_fk"),
+    ("run_ik", "run_ik"),
+    ("set_servo_angle", "set_servo_angle"),
+)
+
 
 class ISkillExecutor(ABC):
     """Abstract interface for a component that executes intents."""
@@ -23,46 +42,68 @@ class SkillExecutor(ISkillExecutor):
     A concrete implementation of ISkillExecutor that maps intent types
     to methods of the RobotTools class.
     """
+    # Kinematics solves depend only on their arguments, so their results are reused.
+    PURE_TOOLS = frozenset({"run_fk", "run_ik"})
+    # Hardware reads are never reused here: the robot may move between two of them,
+    # whether commanded by the agent or not. RobotTools already shares reads that overlap.
+    READ_TOOLS = frozenset({"get_tcp_pose", "get_joint_positions", "get_state"})
+    # Upper bound on cached results before stale ones are dropped
+    MAX_CACHED_RESULTS = 256
 
     def __init__(self, robot_tools: RobotTools, state_cache: StateCache):
         self.robot_tools = robot_tools
         self.state_cache = state_cache
-        self.skill_map: Dict[str, Callable[..., Result[Any]]] = self._build_skill_map()
-
-    def _build_skill_map(self) -> Dict[str, Callable[..., Result[Any]]]:
-        """Creates a mapping from intent types to robot tool methods."""
-        return {
-            "get_tcp_pose": self.robot_tools.get_tcp_pose,
-            "get_joint_positions": self.robot_tools.get_joint_positions,
-            "get_state": self.robot_tools.get_state,
-            "move_p2p_pose": self.robot_tools.move_p2p,
-            "move_p2p_joints": self.robot_tools.move_p2p,
-            "set_gripper": self.robot_tools.set_gripper,
-            "stop": self.robot_tools.stop,
-            "run_fk": self.robot_tools.run_fk,
-            "run_ik": self.robot_tools.run_ik,
-            "set_servo_angle": self.robot_tools.set_servo_angle,
+        # Bind the robot tool methods once; execute_tool_call then needs a single dict lookup.
+        self.skill_map: Dict[str, Callable[..., Result[Any]]] = {
+            name: getattr(robot_tools, attr) for name, attr in _SKILL_NAMES
         }
+        self._result_cache: Dict[tuple, Result] = {}
 
     async def execute_tool_call(self, tool_call: ToolCall) -> Result:
         """Executes a tool call by looking it up in the skill map."""
-        print(f"[executor] Executing tool: {tool_call.name} with args: {tool_call.args}")
+        _log.debug("Executing tool: %s with args: %s", tool_call.name, tool_call.args)
         
         skill_func = self.skill_map.get(tool_call.name)
         if not skill_func:
             err_msg = f"Unknown tool: '{tool_call.name}'"
-            print(f"[error] {err_msg}")
+            _log.error(err_msg)
             return Result.err(code="tool_not_found", message=err_msg)
 
+        if tool_call.name in self.READ_TOOLS:
+            result = await self._call_skill(skill_func, tool_call)
+            if result.ok and tool_call.name == "get_state":
+                # Record the snapshot; if it is unchanged, the JSON serialized for an earlier read is reused
+                self.state_cache.set(result.data)
+                result = Result(ok=True, data=result.data, _data_json=self.state_cache.get_json())
+            return result
+
+        if tool_call.name not in self.PURE_TOOLS:
+            return await self._call_skill(skill_func, tool_call)
+
+        key = (tool_call.name, orjson.dumps(tool_call.args, option=orjson.OPT_SORT_KEYS))
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            _log.debug("Reusing cached result for: %s", tool_call.name)
+            return cached
+
+        result = await self._call_skill(skill_func, tool_call)
+        if result.ok:
+            if len(self._result_cache) >= self.MAX_CACHED_RESULTS:
+                self._result_cache.clear()
+            self._result_cache[key] = result
+        return result
+
+    async def _call_skill(self, skill_func: Callable[..., Result[Any]], tool_call: ToolCall) -> Result:
+        """Calls a skill, turning bad arguments and unexpected exceptions into error results."""
         try:
             # Await the coroutine function with the provided arguments
             result = await skill_func(**tool_call.args)
             return result
         except TypeError as e:
             err_msg = f"Invalid parameters for tool '{tool_call.name}': {e}"
-            print(f"[error] {err_msg}")
+            _log.error(err_msg)
             return Result.err(code="invalid_params", message=err_msg)
         except Exception as e:
             err_msg = f"An unexpected error occurred during tool execution: {e}"
-            print(f"[error] {err_msg}")
+            _log.error(err_msg)
             return Result.err(code="execution_failed", message=err_msg)
@@ -1,14 +1,29 @@
 """State cache stub."""
 from __future__ import annotations
+from typing import Optional
+
+import orjson
 from core.types import RobotState
 
 
 class StateCache:
     def __init__(self):
         self._state = RobotState()
+        # JSON form of the current state, built on first request and kept until the state changes
+        self._state_json: Optional[str] = None
 
     def get(self) -> RobotState:
         return self._state
 
+    def get_json(self) -> str:
+        """Returns the current state serialized for the agent."""
+        if self._state_json is None:
+            self._state_json = orjson.dumps(self._state.to_dict()).decode()
+        return self._state_json
+
     def set(self, state: RobotState) -> None:
+        if state == self._state:
+            # An identical snapshot keeps the JSON serialized for the old one
+            return
         self._state = state
+        self._state_json = None
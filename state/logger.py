@@ -1,14 +1,42 @@
-"""Logger stub (prints to stdout)."""
+"""Logging setup: records are queued on the caller's thread and written to stdout by a background thread."""
 from __future__ import annotations
+import logging
+import logging.handlers
+import queue
+import sys
 from core.types import ILogger
 
 
+def setup_logging(level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """
+    Routes all log records through a queue, so logging never blocks the event loop on console I/O.
+    :param level: The minimum level that is logged; below it, messages are not even formatted.
+    :return: The started listener; call its stop() on shutdown to flush the remaining records.
+    """
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("[%(name)s] %(levelname)s %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, console)
+    listener.start()
+    return listener
+
+
 class Logger(ILogger):
+    """ILogger adapter over the stdlib logging module."""
+
+    def __init__(self, name: str = "app"):
+        self._log = logging.getLogger(name)
+
     def info(self, msg: str) -> None:
-        print(f"[INFO] {msg}")
+        self._log.info(msg)
 
     def warning(self, msg: str) -> None:
-        print(f"[WARN] {msg}")
+        self._log.warning(msg)
 
     def error(self, msg: str) -> None:
-        print(f"[ERROR] {msg}")
+        self._log.error(msg)
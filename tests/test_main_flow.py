@@ -5,15 +5,18 @@ These tests validate the correct orchestration of the LLMMode, Agent, and Tools.
 """
 import asyncio
 import json
+import time
 from typing import List, Dict, Any, Optional
 
+import httpx
 import pytest
-from core.types import AgentMessage, Result, ToolCall
+from agents.agent import LLMAgent
+from core.types import AgentMessage, Joints, Pose, Result, ToolCall
 from agents.base import IAgent
 from skills.executor import SkillExecutor
 from tools.robot_tools import RobotTools
 from voice.asr import IVoiceInput
-from voice.tts import IVoiceOutput
+from voice.tts import GTTSOutput, IVoiceOutput
 from modes.llm_mode import LLMMode
 from state.cache import StateCache
 
@@ -56,6 +59,8 @@ class FakeAgent(IAgent):
         self.responses: List[Result[AgentMessage]] = []
         # A record of message histories received by the agent
         self.received_histories: List[List[AgentMessage]] = []
+        # A record of whether tools were offered on each call
+        self.received_allow_tools: List[bool] = []
         self._response_index = 0
 
     def add_response(self, message: AgentMessage, is_error: bool = False):
@@ -65,9 +70,10 @@ class FakeAgent(IAgent):
         else:
             self.responses.append(Result.ok(message))
 
-    async def run(self, messages: List[AgentMessage]) -> Result[AgentMessage]:
+    async def run(self, messages: List[AgentMessage], allow_tools: bool = True) -> Result[AgentMessage]:
         """Returns the next pre-programmed response."""
         self.received_histories.append(messages.copy())
+        self.received_allow_tools.append(allow_tools)
         if self._response_index < len(self.responses):
             response = self.responses[self._response_index]
             self._response_index += 1
@@ -75,6 +81,24 @@ class FakeAgent(IAgent):
         # Default to a stop message if we run out of programmed responses
         return Result.ok(AgentMessage(role="assistant", content="No more programmed responses."))
 
+def make_agent(**kwargs) -> LLMAgent:
+    """Builds a real LLMAgent over the dummy robot components."""
+    robot_tools = RobotTools(driver=DummyRobot(), kinematics=DummyKinematics(), safety=ConsoleSafety(), servo=MockServo())
+    return LLMAgent(robot_tools=robot_tools, api_url="http://llm.test/api/v1", model="test-model", **kwargs)
+
+def use_transport(agent: LLMAgent, handler) -> None:
+    """Routes the agent's HTTP requests to `handler` instead of the network."""
+    agent._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+def sse_response(*chunks) -> httpx.Response:
+    """Builds a streaming chat completion response from the given chunk dicts."""
+    body = b"".join(b"data: " + json.dumps(chunk).encode() + b"\n\n" for chunk in chunks)
+    return httpx.Response(200, content=body + b"data: [DONE]\n\n")
+
+def delta(**fields) -> Dict[str, Any]:
+    """Wraps a delta into a stream chunk."""
+    return {"choices": [{"delta": fields}]}
+
 # --- Pytest Fixtures ---
 
 @pytest.fixture
@@ -342,4 +366,686 @@ async def test_long_term_memory_conversation(llm_mode, fake_agent, fake_voice_ou
     assert history_for_second_call[2].content == request_2
 
     # 3. Check that the final answer was spoken
-    assert response_2.content in fake_voice_out.spoken_text
\ No newline at end of file
+    assert response_2.content in fake_voice_out.spoken_text
+
+@pytest.mark.asyncio
+async def test_run_batch_keeps_conversations_separate(llm_mode, fake_agent, fake_voice_out):
+    """
+    Tests that batch conversations each get their own history and leave the mode's history untouched.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    requests = ["First request", "Second request"]
+    fake_agent.add_response(AgentMessage(role="assistant", content="First answer"))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Second answer"))
+
+    # Act
+    histories = await llm_mode.run_batch(requests, qpm=6000)
+
+    # Assert
+    assert len(histories) == 2
+    for request, history in zip(requests, histories):
+        assert len(history) == 2
+        assert history[0].role == "user"
+        assert history[0].content == request
+        assert history[1].role == "assistant"
+    assert len(llm_mode.history) == 0
+    # Batch answers are not spoken, there is nobody listening
+    assert "First answer" not in fake_voice_out.spoken_text
+    assert "Second answer" not in fake_voice_out.spoken_text
+
+
+@pytest.mark.asyncio
+async def test_last_step_is_sent_without_tools(llm_mode, fake_agent, fake_voice_out):
+    """
+    Tests that when the agent keeps calling tools, its last allowed step may not call tools.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    for i in range(llm_mode.MAX_STEPS - 1):
+        fake_agent.add_response(AgentMessage(
+            role="assistant",
+            tool_calls=[ToolCall(id=f"call_{i}", name="get_joint_positions", args={})]
+        ))
+    final_answer = "I ran out of steps."
+    fake_agent.add_response(AgentMessage(role="assistant", content=final_answer))
+
+    # Act
+    await llm_mode._run_agent_loop("Keep reading joints.")
+
+    # Assert
+    assert fake_agent.received_allow_tools == [True] * (llm_mode.MAX_STEPS - 1) + [False]
+    assert final_answer in fake_voice_out.spoken_text
+
+
+@pytest.mark.asyncio
+async def test_tool_results_keep_call_order(llm_mode, fake_agent, fake_voice_out):
+    """
+    Tests that tool messages follow the order of the tool calls even when an earlier tool finishes last.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[
+            ToolCall(id="call_slow", name="set_servo_angle", args={"angle": 90}),  # the mock servo sleeps
+            ToolCall(id="call_fast", name="get_joint_positions", args={}),
+        ]
+    ))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Done."))
+
+    # Act
+    await llm_mode._run_agent_loop("Move the servo and read the joints.")
+
+    # Assert
+    history_2 = fake_agent.received_histories[1]
+    assert [history_2[-2].tool_call_id, history_2[-1].tool_call_id] == ["call_slow", "call_fast"]
+    assert fake_voice_out.spoken_text[-2:] == [llm_mode.FILLER_PHRASE, "Done."]
+
+
+@pytest.mark.asyncio
+async def test_kinematics_results_are_cached_but_reads_are_not(llm_mode):
+    """
+    Tests that repeated kinematics solves reuse the cached result, while every hardware read goes to the robot.
+    """
+    # Arrange
+    executor = llm_mode.skill_executor
+    solve = ToolCall(id="call_fk", name="run_fk", args={"joints": {"values": [0.0] * 6}})
+    read = ToolCall(id="call_read", name="get_joint_positions", args={})
+
+    # Act
+    first_solve = await executor.execute_tool_call(solve)
+    second_solve = await executor.execute_tool_call(solve)
+    first_read = await executor.execute_tool_call(read)
+    second_read = await executor.execute_tool_call(read)
+
+    # Assert
+    assert second_solve is first_solve
+    assert second_read is not first_read
+
+
+class ScriptedVoiceInput(FakeVoiceInput):
+    """A voice input that hears the given phrases once listening starts, and then silence."""
+    def __init__(self, phrases: List[str]):
+        super().__init__("")
+        self._phrases = phrases
+        self._callback = None
+
+    def on_text(self, callback):
+        self._callback = callback
+
+    async def start(self):
+        for phrase in self._phrases:
+            self._callback(phrase, time.monotonic())
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_long_history_is_summarized_after_the_answer(llm_mode, fake_agent, fake_voice_out):
+    """
+    Tests that a history longer than MAX_HISTORY is summarized after the request was answered, not before.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    for i in range(llm_mode.MAX_HISTORY // 2 + 1):
+        llm_mode.history.append(AgentMessage(role="user", content=f"Request {i}"))
+        llm_mode.history.append(AgentMessage(role="assistant", content=f"Answer {i}"))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Done."))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Earlier requests were answered."))
+    llm_mode.voice_in = ScriptedVoiceInput(["New request."])
+
+    # Act
+    loop_task = asyncio.create_task(llm_mode.run_interactive_loop())
+    for _ in range(100):
+        if llm_mode.history[0].role == "system":
+            break
+        await asyncio.sleep(0.01)
+    llm_mode.stop_loop()
+    await asyncio.wait_for(loop_task, timeout=1)
+
+    # Assert
+    assert fake_agent.received_allow_tools == [True, False]
+    assert "Done." in fake_voice_out.spoken_text
+    assert llm_mode.history[0].role == "system"
+    assert "Earlier requests were answered." in llm_mode.history[0].content
+    assert llm_mode.history[-1].content == "Done."
+
+
+@pytest.mark.asyncio
+async def test_duplicate_reads_run_once(llm_mode, fake_agent, fake_voice_out, monkeypatch):
+    """
+    Tests that identical reads in one response are executed once and each gets a tool message,
+    while repeated commands are all executed.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    executed = []
+    execute = llm_mode.skill_executor.execute_tool_call
+
+    async def counting_execute(tool_call):
+        executed.append(tool_call.id)
+        return await execute(tool_call)
+
+    monkeypatch.setattr(llm_mode.skill_executor, "execute_tool_call", counting_execute)
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[
+            ToolCall(id="call_1", name="get_joint_positions", args={}),
+            ToolCall(id="call_2", name="get_joint_positions", args={}),
+        ]
+    ))
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[
+            ToolCall(id="call_3", name="set_servo_angle", args={"angle": 30}),
+            ToolCall(id="call_4", name="set_servo_angle", args={"angle": 60}),
+            ToolCall(id="call_5", name="set_servo_angle", args={"angle": 30}),
+        ]
+    ))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Done."))
+
+    # Act
+    await llm_mode._run_agent_loop("Read the joints, then wave the servo.")
+
+    # Assert
+    assert "call_2" not in executed
+    assert [call_id for call_id in executed if call_id != "call_1"] == ["call_3", "call_4", "call_5"]
+    history_2 = fake_agent.received_histories[1]
+    assert [history_2[-2].tool_call_id, history_2[-1].tool_call_id] == ["call_1", "call_2"]
+    history_3 = fake_agent.received_histories[2]
+    assert [m.tool_call_id for m in list(history_3)[-3:]] == ["call_3", "call_4", "call_5"]
+
+
+@pytest.mark.asyncio
+async def test_stream_joins_content_deltas():
+    """
+    Tests that a streamed final answer is assembled from its content deltas.
+    """
+    # Arrange
+    agent = make_agent(stream=True)
+    use_transport(agent, lambda request: sse_response(
+        delta(role="assistant"), delta(content="Hello, "), delta(content="world.")
+    ))
+
+    # Act
+    result = await agent.run([AgentMessage(role="user", content="Hi")])
+    await agent.aclose()
+
+    # Assert
+    assert result.ok
+    assert result.data.content == "Hello, world."
+    assert not result.data.tool_calls
+
+
+@pytest.mark.asyncio
+async def test_stream_merges_tool_call_fragments():
+    """
+    Tests that streamed tool calls are merged by index, with their arguments split across chunks.
+    """
+    # Arrange
+    agent = make_agent(stream=True)
+    use_transport(agent, lambda request: sse_response(
+        delta(tool_calls=[{"index": 1, "id": "call_b", "function": {"name": "get_tcp_pose", "arguments": ""}}]),
+        delta(tool_calls=[{"index": 0, "id": "call_a", "function": {"name": "set_servo_angle", "arguments": '{"ang'}}]),
+        delta(tool_calls=[{"index": 0, "function": {"arguments": 'le": 30}'}}]),
+    ))
+
+    # Act
+    result = await agent.run([AgentMessage(role="user", content="Move the servo and read the pose.")])
+    await agent.aclose()
+
+    # Assert
+    assert result.ok
+    assert [(tc.id, tc.name, tc.args) for tc in result.data.tool_calls] == [
+        ("call_a", "set_servo_angle", {"angle": 30}),
+        ("call_b", "get_tcp_pose", {}),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stream_decode_error_reports_the_chunk():
+    """
+    Tests that a malformed stream chunk is reported with its text.
+    """
+    # Arrange
+    agent = make_agent(stream=True)
+    use_transport(agent, lambda request: httpx.Response(200, content=b"data: {not json\n\n"))
+
+    # Act
+    result = await agent.run([AgentMessage(role="user", content="Hi")])
+    await agent.aclose()
+
+    # Assert
+    assert not result.ok
+    assert "Failed to decode JSON" in result.error.message
+    assert "{not json" in result.error.message
+
+
+async def send_and_capture(agent: LLMAgent, allow_tools: bool = True) -> Dict[str, Any]:
+    """Runs one agent step against a mock endpoint and returns the parsed request body."""
+    bodies = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(request.content)
+        if agent.stream:
+            return sse_response(delta(content="Done."))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "Done."}}]})
+
+    use_transport(agent, handler)
+    history = [
+        AgentMessage(role="user", content="First request"),
+        AgentMessage(role="assistant", content="First answer"),
+        AgentMessage(role="user", content="Second request"),
+    ]
+    result = await agent.run(history, allow_tools=allow_tools)
+    await agent.aclose()
+    assert result.ok
+    return json.loads(bodies[0])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "options, allow_tools, expected_keys",
+    [
+        ({}, True, {"model", "tools", "messages"}),
+        ({}, False, {"model", "tools", "tool_choice", "messages"}),
+        ({"stream": True}, True, {"model", "tools", "stream", "messages"}),
+        ({"prompt_cache": True}, True, {"model", "tools", "prompt_cache_key", "messages"}),
+        ({"prompt_cache": True}, False, {"model", "tools", "tool_choice", "prompt_cache_key", "messages"}),
+    ],
+)
+async def test_request_body_is_valid_json(options, allow_tools, expected_keys):
+    """
+    Tests that the pre-encoded prefix and the messages join into a valid JSON body with the expected fields.
+    """
+    # Arrange
+    agent = make_agent(**options)
+
+    # Act
+    body = await send_and_capture(agent, allow_tools=allow_tools)
+
+    # Assert
+    assert set(body) == expected_keys
+    assert body["model"] == "test-model"
+    assert [m["content"] for m in body["messages"]] == ["First request", "First answer", "Second request"]
+    if "tools" in body:
+        assert [t["function"]["name"] for t in body["tools"]] == list(agent.robot_tools.TOOLS)
+    if "tool_choice" in body:
+        assert body["tool_choice"] == "none"
+    if "stream" in body:
+        assert body["stream"] is True
+    if "prompt_cache_key" in body:
+        assert body["prompt_cache_key"] == agent._tools_cache_key
+
+
+@pytest.mark.asyncio
+async def test_cache_breakpoint_marks_only_the_last_user_message():
+    """
+    Tests that cache_control adds one breakpoint, on the last user message, without touching the history.
+    """
+    # Arrange
+    agent = make_agent(cache_control=True)
+
+    # Act
+    body = await send_and_capture(agent)
+
+    # Assert
+    first, answer, last = body["messages"]
+    assert first["content"] == "First request"
+    assert answer["content"] == "First answer"
+    assert last["content"] == [{"type": "text", "text": "Second request", "cache_control": {"type": "ephemeral"}}]
+    # The memoized API dict of the message is left as it was
+    assert agent._api_messages[-1]["content"] == "Second request"
+
+
+def test_speech_started_while_busy_is_ignored(llm_mode):
+    """
+    Tests that a phrase which started before the last request finished (e.g. the robot's own answer) is dropped,
+    even though its transcript arrives after the mode became idle.
+    """
+    # Arrange
+    llm_mode._busy = False
+    llm_mode._idle_since = 100.0
+
+    # Act
+    llm_mode._on_voice_text("Echo of the robot's answer", started_at=99.0)
+    llm_mode._on_voice_text("New command", started_at=101.0)
+
+    # Assert
+    assert llm_mode._requests.qsize() == 1
+    assert llm_mode._requests.get_nowait() == "New command"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_state_reads_share_one_driver_read(llm_mode, monkeypatch):
+    """
+    Tests that get_state calls arriving while a read is in progress join it, and later calls read again.
+    """
+    # Arrange
+    robot_tools = llm_mode.skill_executor.robot_tools
+    reads = 0
+    read_joints = robot_tools.driver.read_joints
+
+    async def slow_read_joints():
+        nonlocal reads
+        reads += 1
+        await asyncio.sleep(0.01)
+        return await read_joints()
+
+    monkeypatch.setattr(robot_tools.driver, "read_joints", slow_read_joints)
+
+    # Act
+    results = await asyncio.gather(*(robot_tools.get_state() for _ in range(5)))
+    await robot_tools.get_state()
+
+    # Assert
+    assert all(res.ok for res in results)
+    assert reads == 2
+
+
+class SlowKinematics(DummyKinematics):
+    """Kinematics whose solves finish in reverse order of their first joint, and fail for negative ones."""
+    async def fk(self, joints: Joints) -> Result[Pose]:
+        first = joints.values[0]
+        await asyncio.sleep(0.01 / (abs(first) + 1))
+        if first < 0:
+            return Result.err("fk_failed", f"No pose for {first}")
+        return Result.ok(Pose(x=first, y=0, z=0, rx=0, ry=0, rz=0))
+
+
+@pytest.mark.asyncio
+async def test_fk_batch_keeps_order_and_reports_errors():
+    """
+    Tests that run_fk_batch returns the poses in input order, however the solves finish, and fails if any solve fails.
+    """
+    # Arrange
+    robot_tools = RobotTools(driver=DummyRobot(), kinematics=SlowKinematics(), safety=ConsoleSafety(), servo=MockServo())
+
+    # Act
+    batch_res = await robot_tools.run_fk_batch([Joints([float(i)] * 6) for i in range(5)])
+    single_res = await robot_tools.run_fk_batch([Joints([7.0] * 6)])
+    failed_res = await robot_tools.run_fk_batch([Joints([1.0] * 6), Joints([-1.0] * 6), Joints([2.0] * 6)])
+
+    # Assert
+    assert batch_res.ok
+    assert [pose.x for pose in batch_res.data] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert single_res.ok and [pose.x for pose in single_res.data] == [7.0]
+    assert not failed_res.ok
+    assert failed_res.error.code == "fk_failed"
+
+
+class FlakyServo(MockServo):
+    """
+    A mock servo that records the angles it receives; the commands listed in `fail_on` fail
+    and those in `raise_on` raise, counting from 1.
+    """
+    def __init__(self, fail_on=(), raise_on=()):
+        super().__init__()
+        self.sent: List[int] = []
+        self.fail_on = list(fail_on)
+        self.raise_on = list(raise_on)
+
+    async def set_angle(self, angle: int) -> bool:
+        self.sent.append(angle)
+        if len(self.sent) in self.raise_on:
+            raise OSError("Serial port disconnected")
+        if len(self.sent) in self.fail_on:
+            return False
+        return True
+
+
+@pytest.mark.asyncio
+async def test_repeated_servo_angle_is_skipped():
+    """
+    Tests that repeating the last confirmed servo angle is a noop that doesn't reach the servo.
+    """
+    # Arrange
+    servo = FlakyServo()
+    robot_tools = RobotTools(driver=DummyRobot(), kinematics=DummyKinematics(), safety=ConsoleSafety(), servo=servo)
+
+    # Act
+    first = await robot_tools.set_servo_angle(30)
+    repeated = await robot_tools.set_servo_angle(30)
+    changed = await robot_tools.set_servo_angle(60)
+
+    # Assert
+    assert first.data == {"status": "done"}
+    assert repeated.data == {"status": "noop"}
+    assert changed.data == {"status": "done"}
+    assert servo.sent == [30, 60]
+
+
+@pytest.mark.asyncio
+async def test_failed_servo_command_is_retried():
+    """
+    Tests that after a failed or raising command the servo position is unknown, so the same angle is sent again.
+    """
+    # Arrange
+    servo = FlakyServo(fail_on=[2], raise_on=[4])
+    robot_tools = RobotTools(driver=DummyRobot(), kinematics=DummyKinematics(), safety=ConsoleSafety(), servo=servo)
+
+    # Act
+    await robot_tools.set_servo_angle(30)
+    failed = await robot_tools.set_servo_angle(90)
+    retried = await robot_tools.set_servo_angle(30)
+    with pytest.raises(OSError):
+        await robot_tools.set_servo_angle(90)
+    retried_after_error = await robot_tools.set_servo_angle(30)
+
+    # Assert
+    assert not failed.ok
+    assert failed.error.code == "servo_error"
+    assert retried.data == {"status": "done"}
+    assert retried_after_error.data == {"status": "done"}
+    assert servo.sent == [30, 90, 30, 90, 30]
+
+
+class TrackingRobot(DummyRobot):
+    """
+    A dummy robot that stands at zero joints and can tell whether a goal is active:
+    every command starts a motion that lasts until `arrive()` is called.
+    """
+    def __init__(self):
+        self.commanded: List[Joints] = []
+        self.moving = False
+
+    async def command_joint_goal(self, joints, speed, accel):
+        self.commanded.append(joints)
+        self.moving = True
+        return await super().command_joint_goal(joints, speed, accel)
+
+    async def is_moving(self) -> Result[bool]:
+        return Result.ok(self.moving)
+
+    def arrive(self):
+        self.moving = False
+
+
+def make_counting_tools(driver) -> tuple:
+    """Builds RobotTools over `driver` and returns them with the list of goals passed to the safety check."""
+    robot_tools = RobotTools(driver=driver, kinematics=DummyKinematics(), safety=ConsoleSafety(), servo=MockServo())
+    checked = []
+    check_motion = robot_tools.safety.check_motion
+
+    async def counting_check(goal, state):
+        checked.append(goal)
+        return await check_motion(goal, state)
+
+    robot_tools.safety.check_motion = counting_check
+    return robot_tools, checked
+
+
+@pytest.mark.asyncio
+async def test_move_to_the_current_position_is_checked_but_not_sent():
+    """
+    Tests that a move to where a robot at rest already stands still passes the safety check but skips the driver,
+    also when the agent passes the target as JSON.
+    """
+    # Arrange
+    driver = TrackingRobot()
+    robot_tools, checked = make_counting_tools(driver)
+
+    # Act
+    same = await robot_tools.move_p2p(Joints([0.0] * 6), speed=0.5, accel=0.5)
+    same_json = await robot_tools.move_p2p({"values": [0.0] * 6}, speed=0.5, accel=0.5)
+    other = await robot_tools.move_p2p({"values": [0.5] * 6}, speed=0.5, accel=0.5)
+
+    # Assert
+    assert same.ok and same.data.handle_id == "noop"
+    assert same_json.ok and same_json.data.handle_id == "noop"
+    assert other.ok and other.data.handle_id != "noop"
+    assert len(checked) == 3
+    assert driver.commanded == [Joints([0.5] * 6)]
+
+
+@pytest.mark.asyncio
+async def test_move_back_during_a_motion_is_sent():
+    """
+    Tests that a move back to the current position is sent while the robot is still heading for another goal.
+    """
+    # Arrange
+    driver = TrackingRobot()
+    robot_tools, _ = make_counting_tools(driver)
+
+    # Act: the robot hasn't left P0 yet when it is told to return there
+    away = await robot_tools.move_p2p(Joints([0.5] * 6), speed=0.5, accel=0.5)
+    back = await robot_tools.move_p2p(Joints([0.0] * 6), speed=0.5, accel=0.5)
+
+    # Assert
+    assert away.ok and back.ok
+    assert back.data.handle_id != "noop"
+    assert driver.commanded == [Joints([0.5] * 6), Joints([0.0] * 6)]
+
+
+@pytest.mark.asyncio
+async def test_move_is_sent_when_the_driver_cannot_tell_if_it_moves():
+    """
+    Tests that without a way to confirm no goal is active, every move goes to the driver.
+    """
+    # Arrange
+    robot_tools, _ = make_counting_tools(DummyRobot())
+
+    # Act
+    same = await robot_tools.move_p2p(Joints([0.0] * 6), speed=0.5, accel=0.5)
+
+    # Assert
+    assert same.ok and same.data.handle_id != "noop"
+
+
+@pytest.mark.asyncio
+async def test_run_batch_paces_every_agent_call(llm_mode, fake_agent, monkeypatch):
+    """
+    Tests that qpm limits the agent calls of all batch conversations together, not just their starts.
+    """
+    # Arrange
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[ToolCall(id="call_1", name="get_joint_positions", args={})]
+    ))
+    fake_agent.add_response(AgentMessage(role="assistant", content="First answer"))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Second answer"))
+    call_times = []
+    run = fake_agent.run
+
+    async def timed_run(messages, allow_tools=True):
+        call_times.append(asyncio.get_running_loop().time())
+        return await run(messages, allow_tools)
+
+    monkeypatch.setattr(fake_agent, "run", timed_run)
+
+    # Act
+    await llm_mode.run_batch(["First request", "Second request"], qpm=600)
+
+    # Assert
+    assert len(call_times) == 3
+    gaps = [later - earlier for earlier, later in zip(call_times, call_times[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+@pytest.mark.asyncio
+async def test_reads_are_not_prefetched_after_motion(llm_mode, fake_agent, fake_voice_out, monkeypatch):
+    """
+    Tests that after a step that moved the robot, the next read is taken when asked for, not speculatively.
+    """
+    # Arrange
+    llm_mode.history.clear()
+    executed = []
+    execute = llm_mode.skill_executor.execute_tool_call
+
+    async def recording_execute(tool_call):
+        executed.append(tool_call.id)
+        return await execute(tool_call)
+
+    monkeypatch.setattr(llm_mode.skill_executor, "execute_tool_call", recording_execute)
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[
+            ToolCall(id="call_move", name="set_servo_angle", args={"angle": 45}),
+            ToolCall(id="call_read_1", name="get_joint_positions", args={}),
+        ]
+    ))
+    fake_agent.add_response(AgentMessage(
+        role="assistant",
+        tool_calls=[ToolCall(id="call_read_2", name="get_joint_positions", args={})]
+    ))
+    fake_agent.add_response(AgentMessage(role="assistant", content="Done."))
+
+    # Act
+    await llm_mode._run_agent_loop("Move the servo and watch the joints.")
+
+    # Assert
+    assert executed[:3] == ["call_move", "call_read_1", "call_read_2"]
+
+
+def test_every_agent_tool_can_be_executed(llm_mode):
+    """
+    Tests that every tool advertised to the agent is in the skill map; shutdown is handled by the mode itself.
+    """
+    assert set(RobotTools.TOOLS) - {"shutdown"} <= set(llm_mode.skill_executor.skill_map)
+
+
+class BrokenVoiceInput(FakeVoiceInput):
+    """A voice input whose microphone cannot be opened."""
+    async def start(self):
+        raise OSError("No default input device")
+
+
+@pytest.mark.asyncio
+async def test_interactive_loop_stops_when_voice_input_fails(llm_mode):
+    """
+    Tests that the interactive loop ends, instead of waiting for speech forever, when voice input fails.
+    """
+    # Arrange
+    llm_mode.voice_in = BrokenVoiceInput("")
+
+    # Act
+    await asyncio.wait_for(llm_mode.run_interactive_loop(), timeout=1)
+
+    # Assert
+    assert not llm_mode._is_running
+
+
+class FakeGTTS:
+    """Stands in for gTTS, writing the text itself instead of MP3 audio from the network."""
+    def __init__(self, text: str, **kwargs):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        fp.write(self.text.encode())
+
+
+def test_tts_disk_cache_is_bounded(tmp_path, monkeypatch):
+    """
+    Tests that the disk cache deletes the least recently used phrases beyond DISK_CACHE_SIZE.
+    """
+    # Arrange
+    monkeypatch.setattr("voice.tts.gTTS", FakeGTTS)
+    tts = GTTSOutput(cache_dir=str(tmp_path))
+    tts.DISK_CACHE_SIZE = 2
+
+    # Act
+    for phrase in ("Первая фраза.", "Вторая фраза.", "Третья фраза."):
+        assert tts._synthesize(phrase, "ru", "com") == phrase.encode()
+
+    # Assert
+    assert len(list((tmp_path / "ru_com").glob("*.mp3"))) == 2
@@ -1,18 +1,37 @@
 """MCP Robot tools stub (wraps driver + kinematics + safety)."""
 from __future__ import annotations
-from typing import Optional, Union
-from core.types import ExecutionReport, Joints, MoveHandle, Pose, Result
+import asyncio
+from typing import List, Optional, Union
+from core.types import ExecutionReport, Joints, MoveHandle, Pose, Result, RobotState
 from drivers.base import IRobotDriver, IServo
 from kinematics.base import IKinematics
 from safety.base import ISafetyRules
 
 
 class RobotTools:
+    # Methods exposed to the LLM agent as tools; each must be an async method with a descriptive docstring.
+    TOOLS = (
+        "get_joint_positions",
+        "get_tcp_pose",
+        "move_p2p",
+        "stop",
+        "set_gripper",
+        "run_fk",
+        "run_ik",
+        "get_state",
+        "shutdown",
+        "set_servo_angle",
+    )
+
     def __init__(self, driver: IRobotDriver, kinematics: IKinematics, safety: ISafetyRules, servo: IServo):
         self.driver = driver
         self.kinematics = kinematics
         self.safety = safety
         self.servo = servo
+        # The state read in progress; calls that arrive meanwhile share its driver read + FK
+        self._state_read: Optional[asyncio.Future[Result[RobotState]]] = None
+        # Last angle the servo confirmed, so repeating it needs no round trip to the device
+        self._last_servo_angle: Optional[int] = None
 
     async def get_joint_positions(self) -> Result[Joints]:
         """Gets the current angular positions of all robot joints."""
@@ -23,10 +42,10 @@ class RobotTools:
         Gets the current Tool Center Point (TCP) pose relative to a coordinate frame.
         :param frame: The reference coordinate frame, defaults to "base".
         """
-        joints_res = await self.driver.read_joints()
-        if not joints_res.ok:
-            return joints_res
-        return await self.kinematics.fk(joints_res.data)
+        state_res = await self.get_state()
+        if not state_res.ok:
+            return state_res
+        return Result.ok(state_res.data.tcp)
 
     async def move_p2p(self, target: Union[Pose, Joints], speed: float, accel: float, frame: str = "base") -> Result[MoveHandle]:
         """
@@ -36,20 +55,59 @@ class RobotTools:
         :param accel: The desired movement acceleration.
         :param frame: The reference frame if the target is a Pose, defaults to "base".
         """
+        if isinstance(target, dict):
+            # The agent passes the target as JSON
+            target = Pose(**target) if "x" in target else Joints(**target)
+
         state_res = await self.get_state()
         if not state_res.ok:
             return state_res
+        state = state_res.data
         
-        check = await self.safety.check_motion(target, state_res.data)
+        check = await self.safety.check_motion(target, state)
         if not check.ok:
             return check
+
+        # A robot standing still at the target has nowhere to go, so the driver round trip is skipped
+        if isinstance(target, Joints):
+            current = state.joints
+        else:
+            current = state.tcp if state.tcp is not None and state.tcp.frame == frame else None
+        if current is not None and self._same_target(target, current) and await self._is_standing_still():
+            return Result.ok(MoveHandle("noop"))
             
+        # The robot leaves the state that was just read, so later calls must not join a read started before
+        self._state_read = None
         if isinstance(target, Pose):
             return await self.driver.command_cartesian_goal(target, speed, accel, frame)
         return await self.driver.command_joint_goal(target, speed, accel)
 
+    async def _is_standing_still(self) -> bool:
+        """
+        Checks with the driver that no goal is being executed. The state alone can't tell a robot at rest
+        from one passing through on its way to an earlier goal, so drivers that can't tell count as moving.
+        """
+        is_moving = getattr(self.driver, "is_moving", None)
+        if is_moving is None:
+            return False
+        moving_res = await is_moving()
+        return moving_res.ok and moving_res.data is False
+
+    @staticmethod
+    def _same_target(a: Union[Pose, Joints], b: Union[Pose, Joints], tolerance: float = 1e-4) -> bool:
+        """Checks whether two motion targets are the same point, up to `tolerance` in every coordinate."""
+        if isinstance(a, Joints) and isinstance(b, Joints):
+            return len(a.values) == len(b.values) and all(abs(x - y) < tolerance for x, y in zip(a.values, b.values))
+        if isinstance(a, Pose) and isinstance(b, Pose):
+            return a.frame == b.frame and all(
+                abs(x - y) < tolerance
+                for x, y in ((a.x, b.x), (a.y, b.y), (a.z, b.z), (a.rx, b.rx), (a.ry, b.ry), (a.rz, b.rz))
+            )
+        return False
+
     async def stop(self) -> Result[None]:
         """Stops all robot motion immediately."""
+        self._state_read = None
         return await self.driver.stop()
 
     async def set_gripper(self, state: str, force: Optional[float] = None) -> Result[None]:
@@ -68,12 +126,41 @@ class RobotTools:
         """Runs forward kinematics to calculate a Pose from joint angles."""
         return await self.kinematics.fk(joints)
 
+    async def run_fk_batch(self, joints_batch: List[Joints]) -> Result[List[Pose]]:
+        """
+        Runs forward kinematics for many joint configurations at once, e.g. for the waypoints of a trajectory.
+        The solves run concurrently; the poses are returned in the order of `joints_batch`.
+        :param joints_batch: The joint configurations to solve.
+        """
+        if len(joints_batch) == 1:
+            pose_res = await self.kinematics.fk(joints_batch[0])
+            return Result.ok([pose_res.data]) if pose_res.ok else pose_res
+        results = await asyncio.gather(*(self.kinematics.fk(joints) for joints in joints_batch))
+        for pose_res in results:
+            if not pose_res.ok:
+                return pose_res
+        return Result.ok([pose_res.data for pose_res in results])
+
     async def run_ik(self, pose: Pose, seed: Optional[Joints] = None) -> Result[List[Joints]]:
         """Runs inverse kinematics to find joint solutions for a given Pose."""
         return await self.kinematics.ik(pose, seed)
 
     async def get_state(self) -> Result[RobotState]:
         """Retrieves the full current state of the robot (joints, pose, etc.)."""
+        state_read = self._state_read
+        if state_read is None:
+            state_read = self._state_read = asyncio.ensure_future(self._read_state())
+            state_read.add_done_callback(self._forget_state_read)
+        # Shielded, so a caller that gets cancelled doesn't cancel the read for the others
+        return await asyncio.shield(state_read)
+
+    def _forget_state_read(self, state_read: asyncio.Future) -> None:
+        """Lets the next call start a fresh read once this one is finished."""
+        if self._state_read is state_read:
+            self._state_read = None
+
+    async def _read_state(self) -> Result[RobotState]:
+        """Reads the joints from the driver and computes the TCP pose for them."""
         joints_res = await self.driver.read_joints()
         if not joints_res.ok:
             return Result.err(joints_res.error.code, joints_res.error.message)
@@ -81,8 +168,7 @@ class RobotTools:
         pose_res = await self.kinematics.fk(joints_res.data)
         if not pose_res.ok:
             return Result.err(pose_res.error.code, pose_res.error.message)
-            
-        from core.types import RobotState
+
         return Result.ok(RobotState(joints=joints_res.data, tcp=pose_res.data, mode="idle"))
 
     def heartbeat(self):
@@ -112,14 +198,15 @@ class RobotTools:
         if not 0 <= angle <= 180:
             return Result.err("invalid_angle", "Angle must be between 0 and 180.")
 
-        success = await self.run_in_executor(self.servo.set_angle, angle)
+        if angle == self._last_servo_angle:
+            return Result.ok({"status": "noop"})
+
+        # Until the servo confirms, its position is unknown, also if the command fails or raises
+        self._last_servo_angle = None
+        success = await self.servo.set_angle(angle)
 
         if success:
+            self._last_servo_angle = angle
             return Result.ok({"status": "done"})
         else:
             return Result.err("servo_error", "Failed to set servo angle.")
-
-    @staticmethod
-    async def run_in_executor(func, *args):
-        import asyncio
-        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
@@ -1,8 +1,12 @@
 """Voice input implementation using speech_recognition library."""
 from __future__ import annotations
+import asyncio
+import collections
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, Tuple
 from core.types import TextCallback
 
 import speech_recognition as sr
@@ -35,19 +39,71 @@ class IVoiceInput(ABC):
 class SpeechRecognitionInput(IVoiceInput):
     """
     IVoiceInput implementation using the SpeechRecognition library.
-    It captures audio from a microphone and uses Google Web Speech API for transcription.
+    It captures audio from a microphone and transcribes it with the Google Web Speech API or a local Whisper model.
     """
 
-    def __init__(self, mic_device_index: Optional[int] = None, language: str = "ru-RU"):
+    # webrtcvad only accepts 10, 20 or 30 ms frames of 16-bit mono PCM at a few fixed rates
+    VAD_SAMPLE_RATE = 16000
+    VAD_FRAME_MS = 20
+    # Trailing silence that ends a phrase, and the audio kept from before the speech started
+    VAD_SILENCE_MS = 300
+    VAD_PREROLL_MS = 300
+
+    def __init__(
+        self,
+        mic_device_index: Optional[int] = None,
+        language: str = "ru-RU",
+        vad_aggressiveness: Optional[int] = None,
+        whisper_model: Optional[str] = None,
+    ):
+        """
+        :param vad_aggressiveness: 0-3, enables WebRTC voice activity detection to find where phrases end;
+            None keeps SpeechRecognition's energy threshold. Requires the optional `webrtcvad` package.
+        :param whisper_model: A faster-whisper model name or path (e.g. "small") to transcribe locally;
+            None uses the Google Web Speech API. Requires the optional `faster-whisper` package.
+        """
         self.mic_device_index = mic_device_index
         self.language = language
         self.recognizer = sr.Recognizer()
+        self._vad = self._get_vad(vad_aggressiveness) if vad_aggressiveness is not None else None
+        self._whisper = self._get_whisper(whisper_model) if whisper_model else None
         self.mic = self._get_mic()
         self._callback: Optional[TextCallback] = None
+        self._listening = False
+        # While start() runs, the microphone stays open and calibrated between phrases.
+        # The lock keeps it from being closed in the middle of a capture.
+        self._source: Optional[sr.AudioSource] = None
+        self._mic_lock = threading.Lock()
+
+    @staticmethod
+    def _get_vad(aggressiveness: int):
+        """Creates the voice activity detector, or returns None if webrtcvad is not installed."""
+        try:
+            import webrtcvad
+        except ImportError:
+            print("[warn] webrtcvad is not installed, falling back to the energy threshold for end-of-speech detection.")
+            return None
+        return webrtcvad.Vad(aggressiveness)
+
+    @staticmethod
+    def _get_whisper(model: str):
+        """Loads the local Whisper model, or returns None if faster-whisper is not available."""
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            print("[warn] faster-whisper is not installed, falling back to Google speech recognition.")
+            return None
+        print(f"[config] Loading Whisper model '{model}'...")
+        # int8 weights halve the memory and run fast enough on a CPU for short commands
+        return WhisperModel(model, device="auto", compute_type="int8")
 
     def _get_mic(self) -> Optional[sr.Microphone]:
         """Initializes the microphone, handling potential errors."""
         try:
+            if self._vad is not None:
+                # Read the microphone in frames the detector can classify
+                frame_size = self.VAD_SAMPLE_RATE * self.VAD_FRAME_MS // 1000
+                return sr.Microphone(device_index=self.mic_device_index, sample_rate=self.VAD_SAMPLE_RATE, chunk_size=frame_size)
             return sr.Microphone(device_index=self.mic_device_index)
         except OSError as exc:
             print(f"[warn] Cannot open microphone (device_index={self.mic_device_index}). Set MIC_DEVICE_INDEX env or check audio devices. Error: {exc}")
@@ -68,42 +124,141 @@ class SpeechRecognitionInput(IVoiceInput):
             msg = "Microphone is not available. Set MIC_DEVICE_INDEX or check audio devices and permissions."
             print(f"[error] {msg}")
             return ""
-        
-        with self.mic as source:
-            print("[listening] Speak now...")
-            self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            try:
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=10)
-            except sr.WaitTimeoutError:
-                print("[warn] No speech detected within the timeout period.")
-                return ""
+
+        # Capturing and recognition block for seconds, so they run in a worker thread
+        text, started_at = await asyncio.to_thread(self._listen_blocking)
+        if text and self._callback:
+            self._callback(text, started_at)
+        return text
+
+    def _listen_blocking(self) -> Tuple[str, float]:
+        """Captures one phrase from the microphone and transcribes it; also returns when the phrase started."""
+        with self._mic_lock:
+            if self._source is not None:
+                # In the listening session an empty cycle is the normal idle state, so it stays quiet
+                audio = self._capture(self._source, verbose=False)
+            else:
+                # Outside of start() the microphone is opened and calibrated for this phrase only
+                with self.mic as source:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
+                    audio = self._capture(source)
+        if audio is None:
+            return "", 0.0
+        # The recording ends now, so it started one recording length ago
+        started_at = time.monotonic() - len(audio.frame_data) / (audio.sample_rate * audio.sample_width)
 
         print("[processing] Converting speech to text...")
+        if self._whisper is not None:
+            text = self._transcribe_whisper(audio)
+            if not text:
+                print("[warn] Could not understand audio.")
+                return "", started_at
+            print(f"[you] {text}")
+            return text, started_at
         try:
             text = self.recognizer.recognize_google(audio, language=self.language)
             print(f"[you] {text}")
-            if self._callback:
-                self._callback(text)
-            return text
+            return text, started_at
         except sr.UnknownValueError:
             print("[warn] Could not understand audio.")
-            return ""
+            return "", started_at
         except sr.RequestError as exc:
             print(f"[error] SpeechRecognition API error: {exc}")
             raise RuntimeError(f"SpeechRecognition API error: {exc}") from exc
 
-    async def start(self):
-        """Starts a loop that continuously listens for a single utterance."""
-        print("Starting continuous listening loop. Press Ctrl+C to stop.")
-        while True:
+    def _transcribe_whisper(self, audio: sr.AudioData) -> str:
+        """Transcribes a phrase with the local Whisper model."""
+        import numpy as np  # installed with faster-whisper
+
+        # Whisper expects 16 kHz mono float samples in [-1, 1]
+        pcm = np.frombuffer(audio.get_raw_data(convert_rate=16000, convert_width=2), dtype=np.int16)
+        segments, _ = self._whisper.transcribe(
+            pcm.astype(np.float32) / 32768.0,
+            language=self.language.split("-")[0],
+            beam_size=1,
+            vad_filter=True,
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+    def _capture(self, source: sr.AudioSource, verbose: bool = True) -> Optional[sr.AudioData]:
+        """
+        Records one phrase, or returns None if nobody speaks before the timeout.
+        :param verbose: Whether to print the listening prompt and the timeout warning.
+        """
+        if verbose:
+            print("[listening] Speak now...")
+        if self._vad is not None:
+            audio = self._capture_vad(source, timeout=5, phrase_time_limit=10)
+        else:
             try:
-                await self.listen_once()
-            except KeyboardInterrupt:
+                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=10)
+            except sr.WaitTimeoutError:
+                audio = None
+        if audio is None and verbose:
+            print("[warn] No speech detected within the timeout period.")
+        return audio
+
+    def _capture_vad(self, source: sr.AudioSource, timeout: float, phrase_time_limit: float) -> Optional[sr.AudioData]:
+        """
+        Records one phrase, using voice activity detection on every frame:
+        the phrase ends as soon as VAD_SILENCE_MS of silence follow the speech.
+        """
+        frames_per_second = 1000 // self.VAD_FRAME_MS
+        preroll = collections.deque(maxlen=self.VAD_PREROLL_MS // self.VAD_FRAME_MS)
+        silence_limit = self.VAD_SILENCE_MS // self.VAD_FRAME_MS
+
+        # Wait for the first voiced frame, keeping a little audio from before it so the first syllable isn't cut
+        for _ in range(int(timeout * frames_per_second)):
+            frame = source.stream.read(source.CHUNK)
+            preroll.append(frame)
+            if self._vad.is_speech(frame, source.SAMPLE_RATE):
                 break
-            except Exception as e:
-                print(f"[error] Unhandled exception in listening loop: {e}")
+        else:
+            return None
+
+        frames = list(preroll)
+        silent = 0
+        for _ in range(int(phrase_time_limit * frames_per_second)):
+            frame = source.stream.read(source.CHUNK)
+            frames.append(frame)
+            silent = 0 if self._vad.is_speech(frame, source.SAMPLE_RATE) else silent + 1
+            if silent >= silence_limit:
+                break
+        return sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+    def _open_source(self) -> None:
+        """Opens the microphone and calibrates for ambient noise once for the whole listening session."""
+        with self._mic_lock:
+            if self._source is None:
+                self._source = self.mic.__enter__()
+                self.recognizer.adjust_for_ambient_noise(self._source, duration=0.5)
 
+    def _close_source(self) -> None:
+        """Closes the microphone once the capture in progress, if any, is finished."""
+        with self._mic_lock:
+            if self._source is not None:
+                self._source = None
+                self.mic.__exit__(None, None, None)
+
+    async def start(self):
+        """Continuously listens and passes every recognized phrase to the registered callback."""
+        if self.mic is None:
+            print("[error] Microphone is not available, voice input is disabled.")
+            return
+        await asyncio.to_thread(self._open_source)
+        self._listening = True
+        try:
+            while self._listening:
+                try:
+                    await self.listen_once()
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    print(f"[error] Unhandled exception in listening loop: {e}")
+        finally:
+            # Not awaited: if the loop was cancelled, a capture may still be running in its thread
+            asyncio.get_running_loop().run_in_executor(None, self._close_source)
 
     async def stop(self):
-        """Stops the listening loop (in this implementation, the user must Ctrl+C)."""
-        print("Stopping voice input. Please use Ctrl+C to exit the listening loop.")
+        """Stops the listening loop after the current phrase."""
+        self._listening = False
@@ -1,13 +1,33 @@
 """Voice output (TTS) implementation."""
 from __future__ import annotations
+import asyncio
+import hashlib
+import io
 import os
+import re
+import shutil
+import subprocess
 import tempfile
+import threading
 import uuid
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Optional, Sequence
 
 from gtts import gTTS
 from playsound3 import playsound
 
+# A sentence runs up to terminal punctuation followed by whitespace (so "3.5" is not split), or to the end.
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?]+(?=\s|$)|$)", re.DOTALL)
+
+# Players that can read MP3 from stdin, in order of preference, with the arguments for headless playback.
+_PIPE_PLAYERS = (
+    ("ffplay", ("-nodisp", "-autoexit", "-loglevel", "quiet", "-i", "pipe:0")),
+    ("mpg123", ("-q", "-")),
+)
+
+_DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mcp_tts")
+
 
 class IVoiceOutput(ABC):
     """Abstract interface for a voice output sink (TTS)."""
@@ -17,36 +37,224 @@ class IVoiceOutput(ABC):
         """Synthesizes and speaks the given text."""
         raise NotImplementedError
 
+    async def warm_up(self, phrases: Sequence[str]) -> None:
+        """Prepares phrases that will be spoken later, so they play without delay. Optional for implementations."""
+
 
 class GTTSOutput(IVoiceOutput):
     """
-    IVoiceOutput implementation using Google Text-to-Speech (gTTS) and playsound.
+    IVoiceOutput implementation using Google Text-to-Speech (gTTS).
+    The MP3 audio is piped to ffplay or mpg123 when one is installed, otherwise it is played with playsound.
     """
 
+    # Number of synthesized phrases kept in memory
+    MEMORY_CACHE_SIZE = 128
+    # Number of phrases kept on disk per voice; the least recently used ones are deleted beyond that
+    DISK_CACHE_SIZE = 1000
+
+    def __init__(self, cache_dir: Optional[str] = _DEFAULT_CACHE_DIR):
+        """
+        :param cache_dir: Directory where synthesized phrases are kept between runs; None disables the disk cache.
+        """
+        self._player_cmd = self._find_pipe_player()
+        if self._player_cmd is None:
+            print("[config] Neither ffplay nor mpg123 found, TTS audio goes through temporary files.")
+        # The assistant repeats many phrases, so their audio is reused instead of synthesized again
+        self.cache_dir = cache_dir
+        self._mem_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_cache_lock = threading.Lock()
+
+    @staticmethod
+    def _find_pipe_player() -> Optional[List[str]]:
+        """Returns the command of a player that reads MP3 from stdin, if one is installed."""
+        for name, args in _PIPE_PLAYERS:
+            path = shutil.which(name)
+            if path:
+                return [path, *args]
+        return None
+
     async def speak(self, text: str, lang: str = "ru", tld: str = "com"):
         """
-        Generates an MP3 file from the text, plays it, and then deletes it.
+        Speaks the text sentence by sentence: the next sentence is synthesized while the current one plays,
+        so the user hears the beginning of a long answer without waiting for the whole synthesis.
         """
         if not text:
             print("[warn] TTS received empty text, skipping.")
             return
 
         print(f"[tts] Saying: {text}")
+        sentences = self._split_sentences(text)
+        if not sentences:
+            return
+
+        ahead = asyncio.create_task(asyncio.to_thread(self._synthesize, sentences[0], lang, tld))
+        try:
+            for i in range(len(sentences)):
+                audio = await ahead
+                ahead = None
+                if i + 1 < len(sentences):
+                    ahead = asyncio.create_task(asyncio.to_thread(self._synthesize, sentences[i + 1], lang, tld))
+                if audio:
+                    await asyncio.to_thread(self._play, audio)
+        finally:
+            if ahead is not None:
+                # Interrupted: the audio being synthesized will not be played
+                ahead.cancel()
+
+    async def warm_up(self, phrases: Sequence[str], lang: str = "ru", tld: str = "com") -> None:
+        """
+        Synthesizes the phrases into the cache ahead of time, so when they are spoken later
+        they play without waiting for Google.
+        """
+        for phrase in phrases:
+            for sentence in self._split_sentences(phrase):
+                await asyncio.to_thread(self._synthesize, sentence, lang, tld)
+
+    @staticmethod
+    def _split_sentences(text: str) -> List[str]:
+        """Splits text into the sentences that are synthesized one at a time."""
+        sentences = [m.group().strip() for m in _SENTENCE_RE.finditer(text)]
+        return [sentence for sentence in sentences if sentence]
+
+    def _synthesize(self, text: str, lang: str, tld: str) -> Optional[bytes]:
+        """
+        Returns the MP3 audio for the text, from the memory or disk cache if it was synthesized before.
+        Returns None on failure.
+        """
+        key = hashlib.blake2b(f"{lang}|{tld}|{text}".encode(), digest_size=16).hexdigest()
+        with self._mem_cache_lock:
+            audio = self._mem_cache.get(key)
+            if audio is not None:
+                self._mem_cache.move_to_end(key)
+                return audio
+
+        path = os.path.join(self.cache_dir, f"{lang}_{tld}", f"{key}.mp3") if self.cache_dir else None
+        audio = self._read_cached(path) if path else None
+        if audio is None:
+            buf = io.BytesIO()
+            try:
+                gTTS(text=text, lang=lang, tld=tld, slow=False).write_to_fp(buf)
+            except Exception as e:
+                print(f"[error] Failed to synthesize TTS audio: {e}")
+                return None
+            audio = buf.getvalue()
+            if path:
+                self._write_cached(path, audio)
+                self._prune_disk_cache(os.path.dirname(path))
+
+        with self._mem_cache_lock:
+            self._mem_cache[key] = audio
+            if len(self._mem_cache) > self.MEMORY_CACHE_SIZE:
+                self._mem_cache.popitem(last=False)
+        return audio
+
+    @staticmethod
+    def _read_cached(path: str) -> Optional[bytes]:
+        """Reads a phrase from the disk cache, or returns None if it is not there."""
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            # The modification time marks the phrase as recently used for _prune_disk_cache
+            os.utime(path)
+            return audio
+        except OSError:
+            return None
+
+    def _prune_disk_cache(self, directory: str) -> None:
+        """Deletes the least recently used phrases once the directory holds more than DISK_CACHE_SIZE."""
+        try:
+            entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".mp3")]
+            if len(entries) <= self.DISK_CACHE_SIZE:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+            for entry in entries[:len(entries) - self.DISK_CACHE_SIZE]:
+                os.remove(entry.path)
+        except OSError as e:
+            print(f"[warn] Failed to prune the TTS cache in {directory}: {e}")
+
+    @staticmethod
+    def _write_cached(path: str, audio: bytes) -> None:
+        """Stores a phrase in the disk cache; the file is renamed into place so readers never see a partial one."""
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
         try:
-            tts = gTTS(text=text, lang=lang, tld=tld, slow=False)
-            # Use a temporary file to store the speech
-            tmp_path = os.path.join(tempfile.gettempdir(), f"mcp_reply_{uuid.uuid4().hex}.mp3")
-            tts.save(tmp_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[warn] Failed to cache TTS audio in {path}: {e}")
+            GTTSOutput._remove(tmp_path)
+
+    def _play(self, audio: bytes) -> None:
+        """Plays MP3 audio, streaming it to the player's stdin when possible."""
+        if self._player_cmd is None:
+            self._play_from_file(audio)
+            return
+        try:
+            subprocess.run(self._player_cmd, input=audio, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        except Exception as e:
+            print(f"[error] Failed to play TTS audio: {e}")
+
+    def _play_from_file(self, audio: bytes) -> None:
+        """Plays MP3 audio with playsound, which needs a file, and then deletes the file."""
+        tmp_path = os.path.join(tempfile.gettempdir(), f"mcp_reply_{uuid.uuid4().hex}.mp3")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(audio)
             playsound(tmp_path)
         except Exception as e:
             print(f"[error] Failed to play TTS audio: {e}")
         finally:
-            # Clean up the temporary file
-            if 'tmp_path' in locals() and os.path.exists(tmp_path):
-                try:
-                    os.remove(tmp_path)
-                except OSError as e:
-                    print(f"[warn] Failed to remove temporary TTS file {tmp_path}: {e}")
+            self._remove(tmp_path)
+
+    @staticmethod
+    def _remove(tmp_path: Optional[str]) -> None:
+        """Cleans up a temporary file."""
+        if tmp_path and os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError as e:
+                print(f"[warn] Failed to remove temporary TTS file {tmp_path}: {e}")
+
+
+class PiperOutput(IVoiceOutput):
+    """
+    IVoiceOutput implementation using a local Piper voice model, played through sounddevice.
+    Synthesis needs no network and the audio is streamed straight to the output device, without temporary files.
+    Requires the optional `piper-tts` and `sounddevice` packages.
+    """
+
+    def __init__(self, model_path: str):
+        """
+        :param model_path: Path to the Piper voice model (.onnx), with its .onnx.json config next to it.
+        """
+        # Imported here so that the default gTTS setup does not need the optional packages
+        from piper.voice import PiperVoice
+        import sounddevice
+
+        self._sounddevice = sounddevice
+        # Loading the model is the expensive part, so it is done once for all phrases
+        self.voice = PiperVoice.load(model_path)
+
+    async def speak(self, text: str):
+        """Synthesizes the text and plays the audio as it is produced."""
+        if not text:
+            print("[warn] TTS received empty text, skipping.")
+            return
+
+        print(f"[tts] Saying: {text}")
+        await asyncio.to_thread(self._speak_blocking, text)
+
+    def _speak_blocking(self, text: str) -> None:
+        """Writes the raw PCM chunks of each synthesized sentence to the output stream."""
+        try:
+            with self._sounddevice.RawOutputStream(
+                samplerate=self.voice.config.sample_rate, channels=1, dtype="int16"
+            ) as stream:
+                for audio in self.voice.synthesize_stream_raw(text):
+                    stream.write(audio)
+        except Exception as e:
+            print(f"[error] Failed to speak with Piper: {e}")
 
 
 class ConsoleOutput(IVoiceOutput):